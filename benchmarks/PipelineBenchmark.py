@@ -0,0 +1,347 @@
+"""
+Воспроизводимые замеры производительности конвейера захват -> вывод -> метки без графического окружения.
+
+Сценарии:
+  playback - воспроизведение синтетического видео через VideoThread и MyMainWindow (задержки по этапам,
+             достигнутый темп, выброшенные кадры) при 0/10/100/1000 метках;
+  display  - обработка готовых кадров в потоке интерфейса (FrameHub.updateFrame -> updateFrame -> drawBoxes)
+             без ожидания темпа, со слоем меток из кэша и с перерисовкой слоя на каждом кадре;
+  session  - сохранение и загрузка сессии и поиск метки по клику при большом числе меток;
+  startup  - время от запуска процесса до показа основного окна (в отдельных процессах) и проверка,
+             что при запуске не загружаются OpenCV и вторая привязка Qt.
+
+Видео генерируются детерминированно (кадр зависит только от номера), метки - с фиксированным зерном.
+Результат - JSON; с --baseline результат сравнивается с прошлым прогоном, и при ухудшении сверх
+допуска код возврата равен 1.
+
+Запуск: python -m benchmarks.PipelineBenchmark [--output result.json] [--baseline old.json]
+                                               [--tolerance 0.1] [--quick] [--only startup]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # До создания QApplication
+# Формы импортируются так же, как при запуске приложения из папки forms
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "forms"))
+
+import cv2
+import numpy as np
+from PyQt6 import QtCore
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QApplication
+
+from utils.RoiStore import RoiStore
+
+ROI_COUNTS = (0, 10, 100, 1000)
+# (ширина, высота, кадров в секунду)
+VIDEO_MODES = ((640, 360, 30), (1280, 720, 30), (1920, 1080, 60), (3840, 2160, 30))
+SESSION_SIZES = (1000, 10000, 100000)
+SEED = 12345
+# Метрики, для которых больше - лучше (остальные - время, меньше - лучше)
+HIGHER_IS_BETTER = {"achieved_fps", "frames_per_sec"}
+# Сравниваются устойчивые метрики: хвосты (p99, максимум) на коротких прогонах слишком шумные
+COMPARED_SUFFIXES = ("mean_ms", "p50_ms")
+STARTUP_LIMIT_MS = 1000.  # Предельное время до показа основного окна
+# Запуск приложения до показа окна; печатает момент показа и загруженные тяжелые модули
+STARTUP_SCRIPT = """
+import json, sys, time
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv)
+from MyMainWindow import MyMainWindow
+window = MyMainWindow()
+window.show()
+app.processEvents()
+print(json.dumps({"shown": time.time(), "cv2": "cv2" in sys.modules, "pyside6": "PySide6" in sys.modules}))
+"""
+
+
+def make_video(path: str, width: int, height: int, fps: int, frames: int) -> str:
+    """Синтетическое видео: градиент со сдвигом и номер кадра (содержимое зависит только от номера кадра)"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"[Benchmark] Can't create video {path}")
+    ramp = np.linspace(0, 255, width, dtype=np.float32)
+    for index in range(frames):
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:, :, 0] = (ramp + 4 * index) % 256
+        frame[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+        frame[:, :, 2] = 2 * index % 256
+        cv2.putText(frame, str(index), (width // 10, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    height / 200, (255, 255, 255), max(height // 200, 1))
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def make_bboxes(count: int, width: int, height: int, seed: int = SEED) -> RoiStore:
+    """Метки в случайных (воспроизводимых) местах изображения"""
+    rng = np.random.default_rng(seed)
+    x0 = rng.integers(0, max(width - 40, 1), count)
+    y0 = rng.integers(20, max(height - 40, 21), count)
+    w = rng.integers(10, 120, count)
+    h = rng.integers(10, 120, count)
+    colors = np.array([color.value for color in (Qt.GlobalColor.green, Qt.GlobalColor.red,
+                                                 Qt.GlobalColor.blue, Qt.GlobalColor.yellow)])
+    store = RoiStore()
+    store.extend(np.stack([x0, y0, np.minimum(x0 + w, width), np.minimum(y0 + h, height)], axis=1),
+                 colors[np.arange(count) % len(colors)], [f"roi{i}" for i in range(count)])
+    return store
+
+
+def summarize(samples: List[float]) -> dict:
+    """Перцентили длительностей, мс"""
+    values = np.array(samples) * 1000.
+    return {"count": len(samples),
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "p99_ms": float(np.percentile(values, 99)),
+            "max_ms": float(values.max())}
+
+
+def timed(func: Callable[[], None], repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+class Benchmark:
+    def __init__(self, workdir: str, quick: bool = False):
+        self.workdir = workdir
+        self.quick = quick
+        self.app = QApplication.instance() or QApplication([sys.argv[0]])
+        self.results: Dict[str, dict] = {}
+
+    def newWindow(self):
+        from MyMainWindow import MyMainWindow
+        window = MyMainWindow()
+        window.resize(1280, 800)
+        window.show()
+        self.app.processEvents()
+        return window
+
+    @staticmethod
+    def closeWindow(window):
+        if window.thread is not None:
+            window.threadClose()
+            window.thread.stop()
+        window.indexClose()
+        window.tiledClose()
+        window.hide()
+        window.deleteLater()
+
+    def setBoxes(self, window, count: int, width: int, height: int):
+        """Метки в пикселях кадра источника (как в сессии), на поле вывода они переводятся окном"""
+        window.session.bboxes = make_bboxes(count, width, height)
+        window.invalidateBoxes()
+
+    def playback(self):
+        """Воспроизведение видео в реальном темпе через VideoThread и основное окно"""
+        modes = VIDEO_MODES[:2] if self.quick else VIDEO_MODES
+        seconds = 1 if self.quick else 3
+        for width, height, fps in modes:
+            path = make_video(os.path.join(self.workdir, f"video_{width}x{height}_{fps}.mp4"),
+                              width, height, fps, fps * seconds)
+            for count in ROI_COUNTS:
+                window = self.newWindow()
+                window.openVideo(path)
+                self.setBoxes(window, count, width, height)
+                while not window.thread.isFinished():
+                    self.app.processEvents(QtCore.QEventLoop.ProcessEventsFlag.AllEvents, 5)
+                self.app.processEvents()
+                stats = window.pipelineStats()
+                result = {"frames": stats["put"], "delivered": stats["delivered"], "dropped": stats["dropped"],
+                          "skipped": stats["skipped"], "achieved_fps": stats["achieved_fps"],
+                          "jitter_ms": stats["jitter_ms"], "peak_queue_depth": stats["peaks"].get("queue_depth", 0)}
+                for stage, histogram in stats["stages"].items():
+                    if histogram["count"]:
+                        result.update({f"{stage}_{key}": value for key, value in histogram.items()
+                                       if key in ("p50_ms", "p95_ms", "p99_ms")})
+                self.report(f"playback/{width}x{height}@{fps}/rois={count}", result)
+                self.closeWindow(window)
+
+    def display(self):
+        """Обработка кадров в потоке интерфейса без ожидания темпа"""
+        modes = VIDEO_MODES[:2] if self.quick else VIDEO_MODES
+        repeat = 30 if self.quick else 120
+        for width, height, _ in modes:
+            frames = [np.full((height, width, 3), i * 8 % 256, dtype=np.uint8) for i in range(8)]
+            for count in ROI_COUNTS:
+                window = self.newWindow()
+                window.scrollArea.setVisible(True)
+                self.setBoxes(window, count, width, height)
+                state = {"i": 0}
+
+                def frame():
+                    window.frameHub.updateFrame(frames[state["i"] % len(frames)])
+                    window.imageLabel.repaint()
+                    state["i"] += 1
+
+                def edited_frame():
+                    window.overlay.invalidate()  # Набор меток меняется каждый кадр (рисование мышью)
+                    frame()
+
+                frame()  # Прогрев: первая отрисовка слоя и раскладка подписей
+                cached = timed(frame, repeat)
+                cached["frames_per_sec"] = 1000. / cached["mean_ms"]
+                self.report(f"display/{width}x{height}/rois={count}", cached)
+                self.report(f"display_dirty/{width}x{height}/rois={count}", timed(edited_frame, repeat // 4))
+                self.closeWindow(window)
+
+    def session(self):
+        """Сохранение/загрузка сессии и поиск по клику"""
+        from utils.Session import Session, StreamType
+        from utils.SessionFile import read_session, write_session
+        sizes = SESSION_SIZES[:2] if self.quick else SESSION_SIZES
+        repeat = 5 if self.quick else 20
+        for count in sizes:
+            session = Session()
+            session.filePath = os.path.join(self.workdir, "image.png")
+            session.fileName, session.folderName = "image.png", self.workdir
+            session.streamType = StreamType.image
+            session.bboxes = make_bboxes(count, 4000, 3000)
+            path = os.path.join(self.workdir, f"session_{count}.ssn")
+            self.report(f"session_save/rois={count}", timed(lambda: write_session(session, path), repeat))
+            self.report(f"session_load/rois={count}", timed(lambda: read_session(path), repeat))
+            loaded = read_session(path)
+            rng = np.random.default_rng(SEED)
+            points = rng.integers(0, (4000, 3000), (256, 2))
+            loaded.hit_test(0, 0)  # Раскладка и построение индекса (SpatialIndex) не входят в замер поиска
+            state = {"i": 0}
+
+            def hit():
+                x, y = points[state["i"] % len(points)]
+                loaded.hit_test(int(x), int(y))
+                state["i"] += 1
+
+            def edited_hit():  # Первый клик после правки метки: раскладка и индекс строятся заново
+                roi = loaded.bboxes[0]
+                roi.p0 = roi.p0
+                hit()
+            self.report(f"session_hit_test/rois={count}", timed(hit, 256))
+            self.report(f"session_hit_test_edited/rois={count}", timed(edited_hit, repeat))
+
+    def startup(self):
+        """Холодный запуск приложения в отдельных процессах"""
+        repeat = 3 if self.quick else 10
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]))
+        samples, cv2_loaded, pyside6_loaded = [], False, False
+        for _ in range(repeat):
+            start = time.time()
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=os.path.join(ROOT, "forms"),
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            state = json.loads(output.strip().splitlines()[-1])
+            samples.append(state["shown"] - start)
+            cv2_loaded |= state["cv2"]
+            pyside6_loaded |= state["pyside6"]
+        result = summarize(samples)
+        result.update({"cv2_loaded": cv2_loaded, "pyside6_loaded": pyside6_loaded})
+        self.report("startup", result)
+
+    def report(self, name: str, result: dict):
+        self.results[name] = result
+        main = result.get("p50_ms", result.get("total_p50_ms"))
+        print(f"[Benchmark] {name}: " + (f"p50 {main:.2f} ms" if main is not None else json.dumps(result)))
+
+
+def environment() -> dict:
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "qt": QtCore.QT_VERSION_STR,
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "qpa": os.environ.get("QT_QPA_PLATFORM"),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Сравнение с прошлым прогоном
+    :return: список ухудшений сверх допуска (пустой, если их нет)
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for metric, value in result.items():
+            previous = old.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+                continue
+            if not (metric.endswith(COMPARED_SUFFIXES) or metric in HIGHER_IS_BETTER):
+                continue
+            change = (value - previous) / previous
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            marker = " <-- regression" if worse > tolerance else ""
+            print(f"[Benchmark] {name} {metric}: {previous:.3f} -> {value:.3f} ({change:+.1%}){marker}")
+            if marker:
+                regressions.append(f"{name} {metric}")
+    return regressions
+
+
+def check_startup(results: Dict[str, dict]) -> List[str]:
+    """Абсолютные требования к запуску (проверяются и без прошлого прогона)"""
+    startup = results.get("startup")
+    if startup is None:
+        return []
+    problems = []
+    if startup["p50_ms"] > STARTUP_LIMIT_MS:
+        problems.append(f"startup p50 {startup['p50_ms']:.0f} ms > {STARTUP_LIMIT_MS:.0f} ms")
+    if startup["cv2_loaded"]:
+        problems.append("OpenCV is imported at startup")
+    if startup["pyside6_loaded"]:
+        problems.append("PySide6 is imported at startup")
+    for problem in problems:
+        print(f"[Benchmark] {problem}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности конвейера кадров")
+    parser.add_argument("--output", default=None, help="файл JSON с результатами (по умолчанию - stdout)")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="допустимое ухудшение (доля)")
+    parser.add_argument("--quick", action="store_true", help="сокращенный набор (для быстрой проверки)")
+    parser.add_argument("--only", choices=("startup", "playback", "display", "session"), action="append",
+                        help="выполнить только указанные сценарии")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="dm_bench_") as workdir:
+        benchmark = Benchmark(workdir, args.quick)
+        for scenario in args.only or ("startup", "session", "display", "playback"):
+            getattr(benchmark, scenario)()
+        results = benchmark.results
+
+    document = {"environment": environment(), "quick": args.quick, "results": results}
+    text = json.dumps(document, indent=2, ensure_ascii=False)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as fp:
+            fp.write(text)
+        print(f"[Benchmark] Results are saved to {args.output}")
+
+    regressions = check_startup(results)
+    if args.baseline is not None:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions += compare(results, baseline["results"], args.tolerance)
+    print(f"[Benchmark] Regressions: {len(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
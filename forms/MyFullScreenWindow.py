@@ -1,14 +1,13 @@
-from typing import List
-
-import cv2
-import numpy as np
 from PyQt6 import QtWidgets
-from PyQt6.QtCore import pyqtSignal, pyqtSlot
-from PyQt6.QtGui import QImage, QPixmap, QPalette
+from PyQt6.QtCore import pyqtSignal, pyqtSlot, QSize
+from PyQt6.QtGui import QPixmap, QPalette
 from PyQt6.QtWidgets import QLabel, QSizePolicy
 
 from FullScreenWindow import Ui_Form
-from utils.BoundingBox import BoundingBox
+import resources
+from utils.OverlayLayer import OverlayLayer
+from utils.RoiStore import RoiStore
+from utils.ViewTransform import ViewTransform
 
 
 class MyFullScreenWindow(QtWidgets.QWidget, Ui_Form):
@@ -19,6 +18,7 @@ class MyFullScreenWindow(QtWidgets.QWidget, Ui_Form):
 
     def __init__(self):
         super().__init__()  # Инициализация базовых классов
+        resources.qInitResources()  # Иконка кнопки выхода из полноэкранного режима
         self.setupUi(self)  # Инициализация базовых UI элементов, определенных в базовом классе Ui_FullScreenWindow
         self.imageLabel = QLabel()  # Поле для отображения
         self.imageLabel.setBackgroundRole(QPalette.ColorRole.Base)
@@ -26,27 +26,22 @@ class MyFullScreenWindow(QtWidgets.QWidget, Ui_Form):
         self.imageLabel.setScaledContents(True)
         self.fcScrollArea.setVisible(True)
         self.fcButton.setVisible(True)
-        self.bboxes: List[BoundingBox] = []
+        self.bboxes = RoiStore()
+        self.overlay = OverlayLayer()  # Кэшированный слой меток
+        self.view = ViewTransform()  # Поле вывода <-> пиксели изображения
+        self.source_size = QSize()  # Размер исходного кадра (на экран может выводиться уменьшенная копия)
         self.fcScrollArea.setWidget(self.imageLabel)
         self.fcFullScreenButton.clicked.connect(self.exit_full_screen)
         self.imageLabel.adjustSize()
 
-    @pyqtSlot(np.ndarray)
-    def updateFrame(self, frame):
+    @pyqtSlot(QPixmap)
+    def updateFrame(self, pixmap):
         """
         Функция обновления кадра, производит масштабирование и вывод на imageLabel
-        :param frame: входящий кадр
+        :param pixmap: входящий кадр (общий для всех окон, сконвертирован в FrameHub)
         """
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = image.shape
-        bytes_per_line = ch * w
-        q_image = QImage(image.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-        self.imageLabel.setPixmap(QPixmap(q_image))
-        self.drawBoxes()
-
-    def drawBoxes(self):
-        for bbox in self.bboxes:
-            bbox.draw(self.imageLabel)
+        self.view.update(self.imageLabel.size(), self.source_size if not self.source_size.isEmpty() else pixmap.size())
+        self.imageLabel.setPixmap(self.overlay.composite(pixmap, self.bboxes, self.view))
         self.update()
 
     def setImage(self, pixmap: QPixmap):
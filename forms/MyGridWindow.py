@@ -0,0 +1,132 @@
+import math
+import os.path
+from typing import List, Optional, Union
+
+from PyQt6 import QtWidgets
+from PyQt6.QtCore import pyqtSignal, pyqtSlot, Qt, QSize
+from PyQt6.QtGui import QPixmap, QPalette
+from PyQt6.QtWidgets import QLabel, QSizePolicy, QGridLayout
+
+from utils.CaptureScheduler import CaptureScheduler
+from utils.ChangeDetector import ChangeDetector
+from utils.FrameHub import frameToImage
+from utils.OverlayLayer import OverlayLayer
+from utils.Session import Session
+from utils.SessionFile import READ_ERRORS, read_session
+from utils.VideoThread import VideoThread
+from utils.ViewTransform import ViewTransform
+
+
+class GridTile(QLabel):
+    """
+    Ячейка сетки: собственный поток кадров, собственная сессия (метки из <имя>.ssn рядом с видео)
+    и кэшированный слой меток
+    """
+    focusSignal = pyqtSignal(object)  # Ячейка выбрана щелчком
+    openSignal = pyqtSignal(object)  # Двойной щелчок - открыть источник в основном окне
+
+    def __init__(self, source: Union[int, str], scheduler: CaptureScheduler, decoder_threads: int):
+        super().__init__()
+        self.source = source
+        self.session = self.loadSession(source)
+        self.overlay = OverlayLayer()
+        self.view = ViewTransform()  # Ячейка <-> пиксели исходного кадра (метки сессии хранятся в них)
+        self.setBackgroundRole(QPalette.ColorRole.Base)
+        self.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+        self.setScaledContents(True)
+        self.setFocused(False)
+        # Кэш кадров для шагов назад в сетке не нужен, канал - на один кадр (показывается только свежий)
+        # Камеры обычно смотрят на статичную сцену - неизменившиеся кадры не перерисовываются
+        detector = ChangeDetector() if isinstance(source, int) else None
+        self.thread = VideoThread(source, queue_size=1, cache_budget=0, scheduler=scheduler,
+                                  decoder_threads=decoder_threads, change_detector=detector)
+        self.thread.change_pixmap_signal.connect(self.updateFrame)
+
+    @staticmethod
+    def loadSession(source: Union[int, str]) -> Session:
+        if isinstance(source, str):
+            session_path = os.path.splitext(source)[0] + ".ssn"
+            if os.path.exists(session_path):
+                try:
+                    return read_session(session_path)
+                except READ_ERRORS as e:  # Ячейка открывается без меток, остальные ячейки не затрагиваются
+                    print(f"[GridWindow] Can't load session {session_path}: {e}")
+        return Session()
+
+    def setFocused(self, focused: bool):
+        self.setStyleSheet("border: 2px solid #2a82da;" if focused else "border: 2px solid transparent;")
+
+    @pyqtSlot(object)
+    def updateFrame(self, frame):
+        pixmap = QPixmap.fromImage(frameToImage(frame))
+        full_frame = self.thread.full_frame  # Кадр мог быть уменьшен до ячейки еще в потоке захвата
+        source = full_frame if full_frame is not None else frame
+        self.view.update(self.size(), QSize(source.shape[1], source.shape[0]))
+        self.setPixmap(self.overlay.composite(pixmap, self.session.bboxes, self.view))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        ratio = self.devicePixelRatioF()
+        self.thread.setDisplaySize(self.width() * ratio, self.height() * ratio)  # Кадры уменьшаются до ячейки
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.focusSignal.emit(self)
+
+    def mouseDoubleClickEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.openSignal.emit(self.source)
+
+
+class MyGridWindow(QtWidgets.QWidget):
+    """
+    Окно одновременного просмотра нескольких камер и видео.
+    Декодирование всех ячеек ограничено общим планировщиком: выбранная ячейка идет в полном темпе,
+    остальные - с пониженным, поэтому нагрузка растет медленнее числа источников.
+    """
+    closeSignal = pyqtSignal()
+    openSignal = pyqtSignal(object)  # Источник, который нужно открыть в основном окне
+
+    def __init__(self, sources: List[Union[int, str]], slots: Optional[int] = None, background_fps: float = 5.):
+        super().__init__()
+        self.setWindowTitle("Сетка источников")
+        self.scheduler = CaptureScheduler(slots, background_fps)
+        decoder_threads = self.scheduler.decoderThreads(len(sources))
+        self.tiles: List[GridTile] = []
+        layout = QGridLayout(self)
+        layout.setSpacing(2)
+        columns = math.ceil(math.sqrt(len(sources)))
+        for i, source in enumerate(sources):
+            tile = GridTile(source, self.scheduler, decoder_threads)
+            tile.focusSignal.connect(self.setFocusedTile)
+            tile.openSignal.connect(self.openSignal)
+            layout.addWidget(tile, i // columns, i % columns)
+            self.tiles.append(tile)
+        self.focused: Optional[GridTile] = None
+        if self.tiles:
+            self.setFocusedTile(self.tiles[0])
+        for tile in self.tiles:
+            tile.thread.start()
+
+    @pyqtSlot(object)
+    def setFocusedTile(self, tile: GridTile):
+        """Выбор ячейки, которая показывается в полном темпе"""
+        if self.focused is not None:
+            self.focused.setFocused(False)
+        self.focused = tile
+        tile.setFocused(True)
+        self.scheduler.setFocused(tile.thread)
+
+    def stats(self) -> dict:
+        """Статистика планировщика и потоков кадров всех ячеек"""
+        stats = self.scheduler.stats()
+        stats["tiles"] = [dict(tile.thread.stats(), source=tile.source) for tile in self.tiles]
+        return stats
+
+    def closeEvent(self, event):
+        for tile in self.tiles:
+            tile.thread.close()
+        for tile in self.tiles:
+            tile.thread.stop()  # Ожидание ограничено: зависший источник не задерживает закрытие окна
+        self.closeSignal.emit()
+        event.accept()
@@ -1,22 +1,33 @@
 import os.path
-import pickle
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
-import cv2
 import numpy as np
 from PyQt6 import QtWidgets, QtCore
 from PyQt6.QtCore import pyqtSlot, Qt, QRect
-from PyQt6.QtGui import QImage, QPixmap, QPalette
-from PyQt6.QtWidgets import QFileDialog, QMessageBox, QLabel, QSizePolicy
+from PyQt6.QtGui import QImage, QPixmap, QPalette, QActionGroup
+from PyQt6.QtWidgets import QFileDialog, QMessageBox, QSizePolicy, QLabel
 from PyQt6.QtWidgets import (QWidgetAction,
                              QInputDialog)
 
 from MainWindow import Ui_MainWindow
 from MyFullScreenWindow import MyFullScreenWindow
 from utils.BoundingBox import BoundingBox
+from utils.FrameHub import FrameHub, frameToImage
+from utils.OverlayLayer import OverlayLayer
+from utils.PipelineMetrics import PipelineMetrics, formatStats, OVERLAY, TOTAL
+from utils.RoiExporter import RoiExporter
+from utils.TiledImage import TiledImage, TiledImageBuilder, TiledImageLabel
+from utils.ViewTransform import ViewTransform
+from utils.RoiStore import LABEL, BORDER
 from utils.Session import Session, StreamType
-from utils.VideoThread import VideoThread
-from resources import resources
+from utils.SessionFile import READ_ERRORS, read_session, write_session
+import resources
+
+if TYPE_CHECKING:  # Модули с OpenCV загружаются при первом открытии видео или камеры
+    from MyGridWindow import MyGridWindow
+    from utils.SeekIndex import SeekIndexBuilder
+    from utils.SessionRecorder import SessionRecorder
+    from utils.VideoThread import VideoThread
 
 
 # noinspection PyArgumentList
@@ -27,26 +38,50 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
     def __init__(self):
         super().__init__()  # Инициализация базовых классов
-        self.session: Optional[Session] = None
+        self.session: Session = Session()  # Новая сессия (без обращения к диску)
         self.active_bbox: Optional[BoundingBox] = None  # Активная область
         self.image_pixmap: Optional[QPixmap] = None  # Текущий кадр
         self.last_point = None  # Последняя нажатая точка
         self.drawing = False  # Флаг активного рисования метки
-        self.thread: Optional[VideoThread] = None  # Видео поток
+        self.thread: Optional["VideoThread"] = None  # Видео поток
+        self.indexBuilder: Optional["SeekIndexBuilder"] = None  # Фоновое построение индекса перемотки
+        self.tiledBuilder: Optional[TiledImageBuilder] = None  # Фоновое открытие больших изображений
         self.fullScreenWindow = None
+        self.gridWindow: Optional["MyGridWindow"] = None  # Окно сетки камер и видео
+        self.recorder: Optional["SessionRecorder"] = None  # Запись текущего потока
+        self.recorders = []  # Завершающиеся записи (дописывают принятые кадры)
+        self.playbackRate = 1.  # Скорость воспроизведения видео
+        self.playbackSkip = 0  # Кол-во пропускаемых кадров между показанными
+        self.metrics = PipelineMetrics()  # Задержки по этапам конвейера кадров
+        self.frameHub = FrameHub(self.metrics)  # Однократная конвертация кадров для всех окон
+        self.frameHub.subscribe(self.updateFrame)
+        self.overlay = OverlayLayer()  # Кэшированный слой меток
+        self.exporter = RoiExporter()  # Фоновое сохранение областей интереса
+        self.exporter.finish_signal.connect(self.exportFinished)
+        resources.qInitResources()  # Иконки окна регистрируются перед их созданием
         self.setupUi(self)  # Инициализация базовых UI элементов, определенных в базовом классе Ui_MainWindow
         self.scaleFactor = 0.0  # Множитель при масштабировании изображения
-        self.imageLabel = QLabel()  # Основное поле для вывода изображений
+        self.imageLabel = TiledImageLabel()  # Основное поле для вывода изображений (в т.ч. тайловых)
         self.imageLabel.setBackgroundRole(QPalette.ColorRole.Base)
         self.imageLabel.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
         self.imageLabel.setScaledContents(True)
+        self.imageLabel.metrics = self.metrics
+        self.view = ViewTransform()  # Поле вывода <-> пиксели изображения (метки хранятся в пикселях)
+        self.imageLabel.view = self.view
         self.scrollArea.setWidget(self.imageLabel)
         self.scrollArea.setVisible(False)
+        self.hud = QLabel(self.scrollArea)  # Панель метрик поверх поля вывода
+        self.hud.setStyleSheet("background-color: rgba(0, 0, 0, 160); color: white; "
+                               "font-family: monospace; padding: 4px;")
+        self.hud.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.hud.setVisible(False)
+        self.hudTimer = QtCore.QTimer(self)  # Панель обновляется по таймеру, а не на каждом кадре
+        self.hudTimer.setInterval(500)
+        self.hudTimer.timeout.connect(self.updateHud)
         self.pushButton.setVisible(False)
         self.createActions()
         self.createMenus()
         self.threadOn = False  # Флаг состояния потока вывода
-        self.load_session("")
         self.drawBoxes()
 
     def openImageDialog(self):
@@ -81,6 +116,11 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.updatePaths(path)
         if self.thread is not None:
             self.threadClose()
+        self.tiledClose()
+        if TiledImage.is_large(self.session.filePath):  # Большие изображения не загружаются целиком
+            self.openTiledImage()
+            return
+        self.imageLabel.setTiledImage(None)
         image = QImage(self.session.filePath)
         if image.isNull():
             QMessageBox.information(self, "Открытие изображения", "Не удалось открыть %s." % self.session.filePath)
@@ -100,15 +140,66 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         #     self.imageLabel.adjustSize()
         self.session.streamType = StreamType.image
 
+    def openTiledImage(self):
+        """Открытие большого изображения в тайловом режиме (кэш тайлов строится или загружается в фоне)"""
+        self.image_pixmap = None
+        self.imageLabel.setTiledImage(None)
+        self.imageLabel.clear()
+        self.label.setText(f"Подготовка изображения {self.session.fileName}...")
+        self.session.streamType = StreamType.image
+        self.tiledBuilder = TiledImageBuilder(self.session.filePath)
+        self.tiledBuilder.ready_signal.connect(self.tiledImageReady)
+        self.tiledBuilder.failed_signal.connect(self.tiledImageFailed)
+        self.tiledBuilder.start()
+
+    @pyqtSlot(object)
+    def tiledImageReady(self, tiled: TiledImage):
+        self.imageLabel.setTiledImage(tiled)
+        self.scrollArea.setVisible(True)
+        self.pushButton.setVisible(False)
+        self.fitToWindowAct.setEnabled(True)
+        # Изначально изображение целиком вписывается в окно
+        viewport = self.scrollArea.viewport().size()
+        self.scaleFactor = min(viewport.width() / tiled.width, viewport.height() / tiled.height)
+        if not self.fitToWindowAct.isChecked():
+            self.scrollArea.setWidgetResizable(False)
+            self.imageLabel.resize(self.scaleFactor * tiled.size)
+        self.updateActions()
+        self.zoomOutAct.setEnabled(self.scaleFactor > 0.333)
+        self.label.setText(f"Из файла {self.session.fileName}")
+        self.lineEdit.setText(self.session.folderName)
+        self.drawBoxes()
+
+    @pyqtSlot(str)
+    def tiledImageFailed(self, message: str):
+        self.imageLabel.setTiledImage(None)
+        self.imageLabel.clear()
+        self.label.setText("")
+        QMessageBox.information(self, "Открытие изображения",
+                                "Не удалось открыть %s.\n%s" % (self.session.filePath, message))
+
+    def tiledClose(self):
+        """Остановка открытия предыдущего большого изображения"""
+        if self.tiledBuilder is not None:
+            self.tiledBuilder.requestInterruption()
+            self.tiledBuilder.wait()
+            self.tiledBuilder = None
+
     def openCamera(self, source=0):
         """
         Функция включения веб-камеры.
         """
         self.threadClose()  # Очищаем текущий кадр, закрываем поток кадров
+        self.tiledClose()
+        self.imageLabel.setTiledImage(None)
+        from utils.ChangeDetector import ChangeDetector
+        from utils.VideoThread import VideoThread
         self.session.camera_id = source
-        self.thread = VideoThread(self.session.camera_id)  # Создаем объект потока кадров с веб-камеры
+        self.metrics.reset()
+        # Создаем объект потока кадров с веб-камеры; кадры статичной сцены не перерисовываются
+        self.thread = VideoThread(self.session.camera_id, metrics=self.metrics, change_detector=ChangeDetector())
         # добавляем к потоку метод обновления кадра
-        self.thread.change_pixmap_signal.connect(self.updateFrame)
+        self.thread.change_pixmap_signal.connect(self.frameHub.updateFrame)
         self.thread.start()  # Запускаем входящий поток
         self.threadOn = True  # Устанавливаем флаг, что видео-поток запущен
         self.pushButton.setVisible(True)  # Делаем кнопку видимой
@@ -125,12 +216,50 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         """
         filePath, _ = QFileDialog.getOpenFileName(self, 'QFileDialog.getOpenFileName()', '../sample_data/', '')
         if filePath:
-            self.updatePaths(filePath)
-            sessionPath = os.path.splitext(filePath)[0] + ".ssn"
-            if os.path.exists(sessionPath):
-                self.load_session(sessionPath)
-            else:
-                self.openVideo()
+            self.openVideoFile(filePath)
+
+    def openVideoFile(self, filePath):
+        """Открытие видео-файла вместе с сохраненной для него сессией (если она есть)"""
+        self.updatePaths(filePath)
+        sessionPath = os.path.splitext(filePath)[0] + ".ssn"
+        if os.path.exists(sessionPath):
+            self.load_session(sessionPath)
+        else:
+            self.openVideo()
+
+    def openGridDialog(self):
+        """Выбор нескольких видео-файлов для одновременного просмотра в сетке"""
+        filePaths, _ = QFileDialog.getOpenFileNames(self, 'Открытие видео для сетки', '../sample_data/', '')
+        if filePaths:
+            self.openGrid(filePaths)
+
+    def openGrid(self, sources):
+        """
+        Открытие окна сетки
+        :param sources: пути до видео-файлов и/или номера камер
+        """
+        from MyGridWindow import MyGridWindow
+        self.gridClose()
+        self.gridWindow = MyGridWindow(sources)
+        self.gridWindow.openSignal.connect(self.openGridSource)
+        self.gridWindow.closeSignal.connect(self.gridClosed)
+        self.gridWindow.resize(1280, 720)
+        self.gridWindow.show()
+
+    @pyqtSlot(object)
+    def openGridSource(self, source):
+        """Открытие источника из сетки в основном окне (для работы с метками)"""
+        if isinstance(source, int):  # Камера уже захвачена ячейкой сетки
+            print("[MainWindow] Camera is busy in grid view")
+            return
+        self.openVideoFile(source)
+
+    def gridClose(self):
+        if self.gridWindow is not None:
+            self.gridWindow.close()
+
+    def gridClosed(self):
+        self.gridWindow = None
 
     def openVideo(self, path=None):
         print("[MainWindow] OpenVideo")
@@ -139,12 +268,26 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                 self.updatePaths(path)
             if self.thread is not None:
                 self.threadClose()
-            self.thread = VideoThread(source=self.session.filePath, fps=30)  # Создаем объект потока кадров из файла
+            self.tiledClose()
+            self.imageLabel.setTiledImage(None)
+            from utils.SeekIndex import SeekIndexBuilder
+            from utils.VideoThread import VideoThread
+            self.metrics.reset()
+            # Создаем объект потока кадров из файла
+            self.thread = VideoThread(source=self.session.filePath, metrics=self.metrics,
+                                      rate=self.playbackRate, skip=self.playbackSkip)
             # Добавляем к потоку метод обновления кадра
-            self.thread.change_pixmap_signal.connect(self.updateFrame)
+            self.thread.change_pixmap_signal.connect(self.frameHub.updateFrame)
             self.thread.finish_signal.connect(self.threadFinished)
             self.threadOn = True  # Устанавливаем флаг, что видео-поток запущен
             self.thread.start()  # Запускаем входящий поток
+            self.indexClose()
+            self.indexBuilder = SeekIndexBuilder(self.session.filePath)  # Индекс перемотки строится в фоне
+            self.indexBuilder.ready_signal.connect(self.thread.setSeekIndex)
+            self.indexBuilder.start()
+            self.goToFrameAct.setEnabled(True)
+            self.prevFrameAct.setEnabled(True)
+            self.nextFrameAct.setEnabled(True)
             self.scrollArea.setVisible(True)
             self.pushButton.setVisible(True)  # Делаем кнопку видимой
             self.pushButton.setText("Stop")  # Меняем надпись на "Стоп"
@@ -173,8 +316,12 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         if self.thread is not None:  # сигнал видео-потока
             self.fullScreenWindow.setImage(self.imageLabel.pixmap())
             self.fullScreenWindow.bboxes = self.session.bboxes
-            self.thread.change_pixmap_signal.connect(self.fullScreenWindow.updateFrame)
+            self.fullScreenWindow.source_size = self.sourceSize()
+            self.frameHub.subscribe(self.fullScreenWindow.updateFrame)
             self.fullScreenWindow.fcButton.setVisible(True)
+        elif self.imageLabel.tiled is not None:  # большое изображение - выводится уменьшенный уровень
+            self.fullScreenWindow.setImage(QPixmap.fromImage(frameToImage(self.imageLabel.tiled.preview())))
+            self.fullScreenWindow.fcButton.setVisible(False)
         else:  # изображение
             self.fullScreenWindow.setImage(self.imageLabel.pixmap())
             self.fullScreenWindow.fcButton.setVisible(False)
@@ -192,6 +339,8 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         - возобновляет просмотр в основном окне
         """
         self.fullScreenWindow.closeSignal.disconnect(self.closeFullScreen)
+        if self.thread is not None:
+            self.frameHub.unsubscribe(self.fullScreenWindow.updateFrame)
         self.scrollArea.setWidget(self.imageLabel)
         self.scrollArea.setVisible(True)
         self.imageLabel.setVisible(True)
@@ -200,61 +349,163 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.thread.resume()
             self.threadOn = True
 
-    @pyqtSlot(np.ndarray)
-    def updateFrame(self, frame):
+    @pyqtSlot(QPixmap)
+    def updateFrame(self, pixmap):
         """
         Метод обновления кадра
-        :param frame: новый кадр, который необходимо отобразить
+        :param pixmap: новый кадр, который необходимо отобразить (уже сконвертирован в FrameHub)
         """
-
-        def frameToPixmap(input_frame):
-            image = cv2.cvtColor(input_frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = image.shape
-            bytes_per_line = ch * w
-            q_image = QImage(image.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-            return QPixmap(q_image)
-
-        pixmap = frameToPixmap(frame)
         self.image_pixmap = pixmap
         self.imageLabel.setPixmap(pixmap)
         self.drawBoxes()
+        if self.thread is not None:  # От начала декодирования до кадра с метками, готового к отрисовке
+            self.metrics.record(TOTAL, self.thread.frame_start)
         self.fitToWindowAct.setEnabled(True)
+        self.updateDisplaySize()
+
+    def updateDisplaySize(self):
+        """Передача размера поля вывода видеопотоку - кадры уменьшаются до него еще в потоке захвата"""
+        if self.thread is None:
+            return
+        label = self.fullScreenWindow.imageLabel if self.fullScreenWindow is not None else self.imageLabel
+        ratio = label.devicePixelRatioF()
+        self.thread.setDisplaySize(label.width() * ratio, label.height() * ratio)
+
+    def sourceSize(self) -> QtCore.QSize:
+        """Размер исходного кадра (на экран может выводиться уменьшенная копия)"""
+        if self.session.streamType != StreamType.image and self.thread is not None \
+                and self.thread.full_frame is not None:
+            h, w = self.thread.full_frame.shape[:2]
+            return QtCore.QSize(w, h)
+        if self.imageLabel.tiled is not None:
+            return self.imageLabel.tiled.size
+        return self.image_pixmap.size() if self.image_pixmap is not None else QtCore.QSize()
+
+    def updateView(self) -> bool:
+        """Пересчет преобразования координат, если изменился масштаб или размер изображения"""
+        return self.view.update(self.imageLabel.size(), self.sourceSize())
+
+    def sourceRect(self, bbox: BoundingBox) -> QRect:
+        """Область метки в пикселях исходного кадра (в пределах кадра)"""
+        return bbox.image_rect().intersected(QRect(QtCore.QPoint(), self.sourceSize()))
+
+    def cropRoi(self, bbox: BoundingBox) -> QPixmap:
+        """
+        Вырезка области интереса из полноразмерного кадра
+        :param bbox: метка (углы в пикселях изображения)
+        :return: вырезанная область в исходном разрешении
+        """
+        source_rect = self.sourceRect(bbox)
+        if self.session.streamType != StreamType.image and self.thread is not None \
+                and self.thread.full_frame is not None:
+            roi = self.thread.full_frame[source_rect.top():source_rect.top() + source_rect.height(),
+                                         source_rect.left():source_rect.left() + source_rect.width()]
+            return QPixmap.fromImage(frameToImage(roi))
+        if self.imageLabel.tiled is not None:  # Вырезка из тайлов в исходном разрешении
+            return QPixmap.fromImage(frameToImage(self.imageLabel.tiled.crop(source_rect)))
+        return self.image_pixmap.copy(source_rect)
 
     def drawBoxes(self):
-        if self.image_pixmap is not None:
-            self.imageLabel.setPixmap(self.image_pixmap)
-        for bbox in self.session.bboxes:
-            bbox.draw(self.imageLabel)
-        if self.active_bbox is not None:
-            self.active_bbox.draw(self.imageLabel)
+        if self.imageLabel.tiled is not None:  # Тайловый режим - метки рисуются при отрисовке тайлов
+            self.imageLabel.bboxes = self.session.bboxes
+            self.imageLabel.active_bbox = self.active_bbox
+            self.imageLabel.update()
+            return
+        if self.image_pixmap is None:
+            return
+        start = PipelineMetrics.now()
+        self.updateView()
+        pixmap = self.overlay.composite(self.image_pixmap, self.session.bboxes, self.view, self.active_bbox)
+        self.imageLabel.setPixmap(pixmap)
+        self.metrics.record(OVERLAY, start)
         self.update()
 
+    def invalidateBoxes(self):
+        """Сброс кэша слоя меток после изменения их набора"""
+        self.overlay.invalidate()
+        if self.fullScreenWindow is not None:
+            self.fullScreenWindow.overlay.invalidate()
+        if self.recorder is not None:
+            self.recorder.setRois(self.recordRois())
+
+    def recordRois(self):
+        """Области интереса для записи: (метка, (x0, y0, x1, y1)) в пикселях кадра"""
+        size = self.sourceSize()
+        rects = np.clip(self.session.bboxes.rects(), 0, [size.width(), size.height()] * 2)
+        return list(zip(self.session.bboxes.names(), map(tuple, rects.tolist())))
+
+    def toggleRecording(self):
+        if self.recordAct.isChecked():
+            self.startRecording()
+        else:
+            self.stopRecording()
+
+    def startRecording(self):
+        """Запись полного потока и вырезанных областей интереса в папку сессии"""
+        from utils.SessionRecorder import SessionRecorder
+        if self.thread is None or not self.thread.running:
+            print("[MainWindow] Nothing to record")
+            self.recordAct.setChecked(False)
+            return
+        self.stopRecording()
+        if self.session.streamType == StreamType.camera:
+            stem = f"camera{self.session.camera_id}"
+        else:
+            stem = os.path.splitext(self.session.fileName)[0]
+        fps = self.thread.pacer.fps if self.thread.pacer is not None else 30.
+        self.recorder = SessionRecorder(SessionRecorder.session_folder(self.session.workingDir, stem),
+                                        fps, self.recordRois())
+        self.recorder.start()
+        self.thread.recorder = self.recorder
+        self.recordAct.setChecked(True)
+
+    def stopRecording(self):
+        """Остановка записи (принятые кадры дописываются в фоне)"""
+        if self.recorder is None:
+            return
+        if self.thread is not None:
+            self.thread.recorder = None
+        self.recorder.stop()
+        self.recorders = [recorder for recorder in self.recorders if recorder.isRunning()] + [self.recorder]
+        self.recorder = None
+        self.recordAct.setChecked(False)
+
+    def waitRecording(self):
+        """Ожидание, пока все остановленные записи допишут файлы"""
+        self.stopRecording()
+        for recorder in self.recorders:
+            recorder.wait()
+        self.recorders = []
+
     def mousePress(self, event):
         self.imageLabel.setMouseTracking(True)
         if event.button() == QtCore.Qt.MouseButton.LeftButton:
             x, y = event.pos().x(), event.pos().y()
-            for bbox in self.session.bboxes:
-                if bbox.label_collides(x, y):
-                    text, ok = QInputDialog.getText(self, 'Изменение метки', 'Введите название метки:')
-                    if ok:
-                        bbox.set_label(text)
-                        self.drawBoxes()
-                    return
-                if bbox.border_collides(x, y):
-                    dlg = QMessageBox.question(self, "Удаление метки", "Вы хотите удалить метку?")
-                    if dlg == QMessageBox.StandardButton.Yes:
-                        self.session.bboxes.remove(bbox)
-                        self.drawBoxes()
-                    return
+            self.updateView()
+            bbox, kind = self.session.hit_test(x, y, self.view)
+            if kind == LABEL:
+                text, ok = QInputDialog.getText(self, 'Изменение метки', 'Введите название метки:')
+                if ok:
+                    self.session.rename_bbox(bbox, text)
+                    self.invalidateBoxes()
+                    self.drawBoxes()
+                return
+            if kind == BORDER:
+                dlg = QMessageBox.question(self, "Удаление метки", "Вы хотите удалить метку?")
+                if dlg == QMessageBox.StandardButton.Yes:
+                    self.session.remove_bbox(bbox)
+                    self.invalidateBoxes()
+                    self.drawBoxes()
+                return
             self.drawing = True
-            self.last_point = (x, y)
+            self.last_point = self.view.toImage(x, y)  # Метка строится сразу в пикселях изображения
 
     def mouseMove(self, event):
         """
         Обработка движения мыши для отрисовки метки
         """
         if event.buttons() and Qt.MouseButton.LeftButton and self.drawing:
-            current_point = (event.pos().x(), event.pos().y())
+            current_point = self.view.toImage(event.pos().x(), event.pos().y())
             self.active_bbox = BoundingBox(*self.last_point, *current_point)
             self.drawBoxes()
             self.update()
@@ -265,8 +516,9 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                                             'Введите название метки:')
             if ok:
                 self.active_bbox.set_label(text)
-                self.active_bbox.img = self.image_pixmap.copy(self.active_bbox.bbox)
-                self.session.bboxes.append(self.active_bbox.copy())
+                self.active_bbox.img = self.cropRoi(self.active_bbox)
+                self.session.add_bbox(self.active_bbox.copy())
+                self.invalidateBoxes()
             self.active_bbox = None
             self.drawing = False
             self.drawBoxes()
@@ -294,14 +546,23 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.threadResume()
 
     def threadClose(self):
+        self.stopRecording()
         if self.thread is not None:
             print("[MainWindow] Closing thread...")
             self.threadOn = False  # Предупреждаем о выключении
             self.thread.close()  # Закрываем поток
             self.pushButton.setText("Start")
 
+    def indexClose(self):
+        """Остановка построения индекса перемотки предыдущего видео"""
+        if self.indexBuilder is not None:
+            self.indexBuilder.requestInterruption()
+            self.indexBuilder.wait()
+            self.indexBuilder = None
+
     def threadFinished(self):
         self.pushButton.setText("Start")
+        self.stopRecording()  # Файл закончился - запись завершается
 
     def threadPause(self):
         self.pushButton.setText("Start")
@@ -324,12 +585,89 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             print("[MainWindow] Replay")
             self.thread.start()
 
+    def goToFrame(self):
+        """Переход к кадру видео"""
+        if self.thread is None or self.session.streamType != StreamType.video:
+            return
+        frames = len(self.thread.seek_index) if self.thread.seek_index is not None else 10 ** 9
+        frame, ok = QInputDialog.getInt(self, 'Переход к кадру', 'Номер кадра:',
+                                        max(self.thread.position, 0), 0, max(frames - 1, 0))
+        if ok:
+            if not self.thread.running:
+                self.threadReplay()
+            self.thread.seek(frame)
+
+    def setPlaybackRate(self, rate: float):
+        """Скорость воспроизведения видео (сохраняется для следующих файлов)"""
+        self.playbackRate = rate
+        for action in self.rateGroup.actions():
+            action.setChecked(action.data() == rate)
+        if self.thread is not None:
+            self.thread.setRate(rate)
+
+    def changePlaybackRate(self, faster: bool):
+        """Переход к соседней скорости воспроизведения"""
+        rates = [action.data() for action in self.rateGroup.actions()]
+        index = rates.index(self.playbackRate) if self.playbackRate in rates else rates.index(1.)
+        self.setPlaybackRate(rates[min(max(index + (1 if faster else -1), 0), len(rates) - 1)])
+
+    def skipFramesDialog(self):
+        """Пропуск кадров: показывается каждый (N + 1)-й кадр"""
+        skip, ok = QInputDialog.getInt(self, 'Пропуск кадров', 'Пропускать кадров между показанными:',
+                                       self.playbackSkip, 0, 1000)
+        if ok:
+            self.playbackSkip = skip
+            if self.thread is not None:
+                self.thread.setSkip(skip)
+
+    def stepFrame(self, delta):
+        """Шаг по кадрам видео (воспроизведение ставится на паузу)"""
+        if self.thread is None or self.session.streamType != StreamType.video:
+            return
+        if not self.thread.running:
+            # Воспроизведение дошло до конца файла, а новый запуск отсчитывает кадры заново:
+            # шаг переводится в переход от последнего показанного кадра (дальше последнего шагнуть нельзя)
+            last = self.thread.position
+            self.threadReplay()
+            self.threadPause()
+            self.thread.seek(max(min(last + delta, last), 0))
+            return
+        if not self.thread.paused:
+            self.thread.pause()
+            self.threadPause()
+        self.thread.step(delta)
+
     def zoomIn(self):
         self.scaleImage(1.25)
 
     def zoomOut(self):
         self.scaleImage(0.8)
 
+    def pipelineStats(self) -> dict:
+        """Метрики конвейера кадров: темп, канал, кэш и задержки по этапам (см. VideoThread.stats)"""
+        if self.thread is not None:
+            stats = self.thread.stats()
+            if self.recorder is not None:
+                stats.update(self.recorder.stats())
+            return stats
+        return self.metrics.stats()
+
+    def showMetrics(self):
+        """Показ/скрытие панели метрик поверх поля вывода"""
+        visible = self.showMetricsAct.isChecked()
+        self.hud.setVisible(visible)
+        if visible:
+            self.updateHud()
+            self.hudTimer.start()
+        else:
+            self.hudTimer.stop()
+
+    def updateHud(self):
+        self.hud.setText(formatStats(self.pipelineStats()))
+        self.hud.adjustSize()
+        self.hud.move(8, 8)
+        self.hud.raise_()
+
     def updateActions(self):
         self.zoomInAct.setEnabled(not self.fitToWindowAct.isChecked())
         self.zoomOutAct.setEnabled(not self.fitToWindowAct.isChecked())
@@ -341,14 +679,14 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
     def scaleImage(self, factor):
         self.scaleFactor *= factor
-        self.imageLabel.resize(self.scaleFactor * self.imageLabel.pixmap().size())
+        self.imageLabel.resize(self.scaleFactor * self.sourceSize())
         self.adjustScrollBar(self.scrollArea.horizontalScrollBar(), factor)
         self.adjustScrollBar(self.scrollArea.verticalScrollBar(), factor)
         self.zoomInAct.setEnabled(self.scaleFactor < 3.0)
         self.zoomOutAct.setEnabled(self.scaleFactor > 0.333)
 
     def normalSize(self):
-        self.imageLabel.adjustSize()
+        self.imageLabel.resize(self.sourceSize())
         self.scaleFactor = 1.0
 
     def fitToWindow(self):
@@ -364,6 +702,17 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.actionVideo.triggered.connect(self.openVideoDialog)
         self.actionCamera.triggered.connect(self.openCamera)
 
+        self.recordAct = QWidgetAction(self)
+        self.recordAct.setText("&Record Stream")
+        self.recordAct.setShortcut("Ctrl+R")
+        self.recordAct.setCheckable(True)
+        self.recordAct.triggered.connect(self.toggleRecording)
+
+        self.openGridAct = QWidgetAction(self)
+        self.openGridAct.setText("&Grid...")
+        self.openGridAct.setShortcut("Ctrl+Shift+O")
+        self.openGridAct.triggered.connect(self.openGridDialog)
+
         self.normalSizeAct = QWidgetAction(self)
         self.normalSizeAct.setText("&Normal Size")
         self.normalSizeAct.setShortcut("Ctrl+S")
@@ -389,6 +738,54 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.zoomOutAct.setEnabled(False)
         self.zoomOutAct.triggered.connect(self.zoomOut)
 
+        self.goToFrameAct = QWidgetAction(self)
+        self.goToFrameAct.setText("&Go to Frame...")
+        self.goToFrameAct.setShortcut("Ctrl+G")
+        self.goToFrameAct.setEnabled(False)
+        self.goToFrameAct.triggered.connect(self.goToFrame)
+
+        self.prevFrameAct = QWidgetAction(self)
+        self.prevFrameAct.setText("&Previous Frame")
+        self.prevFrameAct.setShortcut("Ctrl+Left")
+        self.prevFrameAct.setEnabled(False)
+        self.prevFrameAct.triggered.connect(lambda: self.stepFrame(-1))
+
+        self.nextFrameAct = QWidgetAction(self)
+        self.nextFrameAct.setText("Ne&xt Frame")
+        self.nextFrameAct.setShortcut("Ctrl+Right")
+        self.nextFrameAct.setEnabled(False)
+        self.nextFrameAct.triggered.connect(lambda: self.stepFrame(1))
+
+        self.showMetricsAct = QWidgetAction(self)
+        self.showMetricsAct.setText("Show &Metrics")
+        self.showMetricsAct.setShortcut("Ctrl+M")
+        self.showMetricsAct.setCheckable(True)
+        self.showMetricsAct.triggered.connect(self.showMetrics)
+
+        self.rateGroup = QActionGroup(self)  # Скорости воспроизведения
+        for rate in (0.25, 0.5, 1., 2., 4., 8., 16.):
+            action = QWidgetAction(self)
+            action.setText(f"{rate:g}x")
+            action.setData(rate)
+            action.setCheckable(True)
+            action.setChecked(rate == self.playbackRate)
+            action.triggered.connect(lambda checked, rate=rate: self.setPlaybackRate(rate))
+            self.rateGroup.addAction(action)
+
+        self.fasterAct = QWidgetAction(self)
+        self.fasterAct.setText("&Faster")
+        self.fasterAct.setShortcut("Ctrl+]")
+        self.fasterAct.triggered.connect(lambda: self.changePlaybackRate(True))
+
+        self.slowerAct = QWidgetAction(self)
+        self.slowerAct.setText("&Slower")
+        self.slowerAct.setShortcut("Ctrl+[")
+        self.slowerAct.triggered.connect(lambda: self.changePlaybackRate(False))
+
+        self.skipFramesAct = QWidgetAction(self)
+        self.skipFramesAct.setText("S&kip Frames...")
+        self.skipFramesAct.triggered.connect(self.skipFramesDialog)
+
         self.pushButton.clicked.connect(self.toggleVideo)
         self.fullScreenButton.clicked.connect(self.openFullScreen)
 
@@ -397,11 +794,25 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.imageLabel.mouseReleaseEvent = self.mouseRelease
 
     def createMenus(self):
+        self.menuOpen.addAction(self.openGridAct)
+        self.menuFile.addAction(self.recordAct)
         self.menuView.addAction(self.zoomInAct)
         self.menuView.addAction(self.zoomOutAct)
         self.menuView.addAction(self.normalSizeAct)
         self.menuView.addSeparator()
         self.menuView.addAction(self.fitToWindowAct)
+        self.menuView.addSeparator()
+        self.menuView.addAction(self.goToFrameAct)
+        self.menuView.addAction(self.prevFrameAct)
+        self.menuView.addAction(self.nextFrameAct)
+        self.menuSpeed = self.menuView.addMenu("Playback &Speed")
+        self.menuSpeed.addActions(self.rateGroup.actions())
+        self.menuSpeed.addSeparator()
+        self.menuSpeed.addAction(self.fasterAct)
+        self.menuSpeed.addAction(self.slowerAct)
+        self.menuSpeed.addAction(self.skipFramesAct)
+        self.menuView.addSeparator()
+        self.menuView.addAction(self.showMetricsAct)
 
     def closeEvent(self, event):
         """ Обработчик нажатия на крестик (при закрытии приложения) """
@@ -413,32 +824,43 @@ class MyMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             session_name = self.session.fileName.split('.')[0]
             print(f"[MainWindow] Saving session {session_name}")
             session_path = os.path.dirname(self.session.filePath)
-            self.session.save()
+            self.session.save(self.exporter)  # Области сохраняются в фоне, окно закрывается сразу
             print(f"[MainWindow] Path: {os.path.join(session_path, f'{session_name}.ssn')}")
-            with open(os.path.join(session_path, f'{session_name}.ssn'), "wb") as f:
-                pickle.dump(self.session, f, protocol=pickle.HIGHEST_PROTOCOL)
+            write_session(self.session, os.path.join(session_path, f'{session_name}.ssn'))
 
         self.threadClose()
+        if self.thread is not None:
+            self.thread.stop()  # Поток захвата завершается до закрытия окна, ожидание ограничено
+        self.indexClose()
+        self.tiledClose()
+        self.gridClose()
         event.accept()
 
+    @pyqtSlot(int, int)
+    def exportFinished(self, saved, failed):
+        print(f"[MainWindow] Exported ROIs: {saved}, failed or cancelled: {failed}")
+
+    def waitExport(self):
+        """Ожидание завершения фонового сохранения областей (перед выходом из приложения)"""
+        if not self.exporter.wait(0):
+            print("[MainWindow] Waiting for ROI export...")
+            self.exporter.wait()
+
     def load_session(self, session_path):
+        self.overlay.invalidate()
         try:
-            with open(session_path, 'rb') as fp:
-                self.session = pickle.load(fp, fix_imports=True, encoding='ASCII', errors='strict', buffers=None)
-                # self.session.info()
-                if self.session.streamType == StreamType.image:
-                    self.openImage()
-                elif self.session.streamType == StreamType.video:
-                    self.openVideo()
-                elif self.session.streamType == StreamType.camera:
-                    self.openCamera(self.session.camera_id)
-                else:
-                    print("Новая сессия")
-        except pickle.UnpicklingError as e:
-            print("[MainWindow] Не удалось загрузить сессию")
-            self.session = Session()
-        except FileNotFoundError as e:
-            print("[MainWindow] Не удалось загрузить сессию")
+            self.session = read_session(session_path)
+            # self.session.info()
+            if self.session.streamType == StreamType.image:
+                self.openImage()
+            elif self.session.streamType == StreamType.video:
+                self.openVideo()
+            elif self.session.streamType == StreamType.camera:
+                self.openCamera(self.session.camera_id)
+            else:
+                print("Новая сессия")
+        except READ_ERRORS as e:
+            print(f"[MainWindow] Не удалось загрузить сессию: {e}")
             self.session = Session()
 
 
@@ -448,4 +870,7 @@ if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
     MyWindow = MyMainWindow()
     MyWindow.show()
-    sys.exit(app.exec())
+    code = app.exec()
+    MyWindow.waitExport()
+    MyWindow.waitRecording()
+    sys.exit(code)
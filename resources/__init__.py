@@ -0,0 +1,22 @@
+"""
+Ресурсы приложения (иконки окон). Модуль resources.py генерируется из resources.qrc
+командой python -m resources.build и вручную не правится.
+"""
+_registered = False
+
+
+def qInitResources():
+    """Регистрация ресурсов по требованию (перед созданием окон с иконками), повторный вызов ничего не делает"""
+    global _registered
+    if not _registered:
+        from resources import resources
+        resources.qInitResources()
+        _registered = True
+
+
+def qCleanupResources():
+    global _registered
+    if _registered:
+        from resources import resources
+        resources.qCleanupResources()
+        _registered = False
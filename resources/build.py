@@ -0,0 +1,46 @@
+"""
+Пересборка resources.py из resources.qrc.
+
+Компилятор ресурсов Qt 6 (pyside6-rcc или rcc -g python) генерирует модуль для PySide6, который
+регистрирует ресурсы при импорте. После генерации выполняются две механические правки:
+импорт QtCore из PyQt6 (в приложении используется одна привязка Qt) и удаление регистрации
+при импорте (ресурсы регистрируются по требованию через resources.qInitResources()).
+Больше resources.py вручную не правится.
+
+Запуск: python -m resources.build [путь до rcc]
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+QRC = "resources.qrc"
+OUTPUT = "resources.py"
+
+
+def postprocess(text: str) -> str:
+    """Правки сгенерированного модуля: привязка PyQt6 и отсутствие регистрации при импорте"""
+    text = text.replace("from PySide6 import QtCore", "from PyQt6 import QtCore")
+    return re.sub(r"\n+qInitResources\(\)\s*$", "\n", text)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    tool = argv[0] if argv else shutil.which("pyside6-rcc") or shutil.which("rcc")
+    if tool is None:
+        print("[Resources] Resource compiler not found (pyside6-rcc or rcc)")
+        return 1
+    output = os.path.join(FOLDER, OUTPUT)
+    subprocess.run([tool, "-g", "python", QRC, "-o", output], cwd=FOLDER, check=True)
+    with open(output, encoding="utf-8") as fp:
+        text = fp.read()
+    with open(output, "w", encoding="utf-8") as fp:
+        fp.write(postprocess(text))
+    print(f"[Resources] Generated {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
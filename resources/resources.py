@@ -3,7 +3,7 @@
 # Created by: The Resource Compiler for Qt version 6.5.3
 # WARNING! All changes made in this file will be lost!
 
-from PySide6 import QtCore
+from PyQt6 import QtCore
 
 qt_resource_data = b"\
 \x00\x00\x15\x14\
@@ -734,5 +734,3 @@ def qInitResources():
 
 def qCleanupResources():
     QtCore.qUnregisterResourceData(0x03, qt_resource_struct, qt_resource_name, qt_resource_data)
-
-qInitResources()
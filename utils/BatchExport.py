@@ -0,0 +1,178 @@
+"""
+Пакетное извлечение областей интереса по сохраненным сессиям без графического интерфейса.
+
+Обходит дерево папок, для каждого изображения или видео ищет рядом сессию <имя>.ssn и
+сохраняет вырезанные области в папку <имя>_rois/: для изображений - <метка>.png, для видео -
+каждый N-й кадр в <метка>_<номер кадра>.png (или, с --clips, видеоклипы всех меток за одно
+декодирование в папку <имя>_clips/, см. utils.ClipExtractor). Файлы обрабатываются в пуле процессов.
+
+Запуск: python -m utils.BatchExport <папка> [--every N] [--clips] [--output <папка>] [--workers N]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.SessionFile import is_legacy, read_body
+
+IMAGE_EXTENSIONS = {".png", ".jpeg", ".jpg", ".bmp"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".wmv", ".mpg", ".mpeg"}
+UMASK = os.umask(0o022)  # Права создаваемых файлов (mkstemp создает временный файл с правами 0600)
+os.umask(UMASK)
+
+
+def load_rois(session_path: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Загрузка меток сессии
+    :param session_path: путь до файла сессии
+    :return: прямоугольники int[n, 4] (x, y, x_end, y_end) и уникальные имена файлов для меток
+    """
+    if is_legacy(session_path):
+        from utils.SessionFile import read_session  # Старые сессии требуют классов приложения (PyQt6)
+        session = read_session(session_path)
+        coords, _, labels = session.bboxes.arrays()
+    else:
+        _, coords, _, labels = read_body(session_path)
+    rects = np.concatenate([np.minimum(coords[:, :2], coords[:, 2:]),
+                            np.maximum(coords[:, :2], coords[:, 2:])], axis=1)
+    names, seen = [], {}
+    for label in labels:  # Одинаковые имена не должны перезаписывать друг друга
+        seen[label] = seen.get(label, 0) + 1
+        names.append(label if seen[label] == 1 else f"{label}_{seen[label] - 1}")
+    return rects, names
+
+
+def write_png(image: np.ndarray, path: str) -> bool:
+    """Сохранение PNG через временный файл (свой у каждой записи) и атомарное переименование"""
+    ok, data = cv2.imencode(".png", image)
+    if not ok:
+        return False
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data.tobytes())
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def crop(frame: np.ndarray, rect) -> Optional[np.ndarray]:
+    """Вырезка области (срез без копирования), обрезанная по границам кадра"""
+    h, w = frame.shape[:2]
+    x0, y0, x1, y1 = max(rect[0], 0), max(rect[1], 0), min(rect[2], w), min(rect[3], h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return frame[y0:y1, x0:x1]
+
+
+def export_file(media_path: str, session_path: str, output_dir: str, every: int,
+                clips: bool = False) -> Tuple[str, int]:
+    """
+    Извлечение областей интереса одного файла (выполняется в рабочем процессе)
+    :param clips: для видео - сохранять клипы меток вместо отдельных кадров
+    :return: путь до файла и кол-во сохраненных изображений (клипов)
+    """
+    rects, names = load_rois(session_path)
+    if not len(rects):
+        return media_path, 0
+    written = 0
+    stem = os.path.splitext(os.path.basename(media_path))[0]
+    # Вырезки каждого файла - в своей папке: одинаковые метки разных файлов не перезаписывают друг друга
+    rois_dir = os.path.join(output_dir, f"{stem}_rois")
+    if os.path.splitext(media_path)[1].lower() in IMAGE_EXTENSIONS:
+        image = cv2.imread(media_path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"Can't read {media_path}")
+        os.makedirs(rois_dir, exist_ok=True)
+        for rect, name in zip(rects, names):
+            roi = crop(image, rect)
+            if roi is not None and write_png(roi, os.path.join(rois_dir, f"{name}.png")):
+                written += 1
+        return media_path, written
+
+    if clips:
+        from utils.ClipExtractor import extract_clips
+        written, _ = extract_clips(media_path, session_path, os.path.join(output_dir, f"{stem}_clips"))
+        return media_path, written
+    os.makedirs(rois_dir, exist_ok=True)
+    capture = cv2.VideoCapture(media_path)
+    index = 0
+    try:
+        while True:
+            if index % every:
+                if not capture.grab():  # Непоказываемые кадры пропускаются без декодирования в BGR
+                    break
+                index += 1
+                continue
+            ret, frame = capture.read()
+            if not ret:
+                break
+            for rect, name in zip(rects, names):
+                roi = crop(frame, rect)
+                if roi is not None and write_png(roi, os.path.join(rois_dir, f"{name}_{index:06d}.png")):
+                    written += 1
+            index += 1
+    finally:
+        capture.release()
+    return media_path, written
+
+
+def find_jobs(root: str, output: Optional[str]) -> List[Tuple[str, str, str]]:
+    """
+    Поиск медиафайлов с сохраненными сессиями
+    :return: список (медиафайл, сессия, папка вывода)
+    """
+    jobs = []
+    for folder, _, files in os.walk(root):
+        for file in files:
+            stem, ext = os.path.splitext(file)
+            if ext.lower() not in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS:
+                continue
+            session_path = os.path.join(folder, f"{stem}.ssn")
+            if not os.path.exists(session_path):
+                continue
+            output_dir = folder if output is None else os.path.join(output, os.path.relpath(folder, root))
+            jobs.append((os.path.join(folder, file), session_path, output_dir))
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетное извлечение областей интереса по сохраненным сессиям")
+    parser.add_argument("root", help="папка с изображениями и видео")
+    parser.add_argument("--every", type=int, default=1, help="для видео - сохранять каждый N-й кадр")
+    parser.add_argument("--clips", action="store_true", help="для видео - сохранять клипы меток (mp4)")
+    parser.add_argument("--output", default=None, help="папка вывода (по умолчанию - рядом с исходными файлами)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="кол-во процессов")
+    args = parser.parse_args(argv)
+
+    jobs = find_jobs(args.root, args.output)
+    print(f"[BatchExport] Files with sessions: {len(jobs)}")
+    start, total, failed = time.perf_counter(), 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(export_file, media, session, output, max(args.every, 1), args.clips)
+                   for media, session, output in jobs]
+        for future in as_completed(futures):
+            try:
+                path, written = future.result()
+                total += written
+                print(f"[BatchExport] {path}: {written}")
+            except Exception as e:
+                failed += 1
+                print(f"[BatchExport] Failed: {e}")
+    print(f"[BatchExport] Saved {total} ROI {'clips' if args.clips else 'images'} from {len(jobs) - failed} files "
+          f"in {time.perf_counter() - start:.1f} s, failed: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,18 +1,44 @@
 import math
 import os
-from typing import Optional
+from typing import Optional, Tuple
 
 from PyQt6 import QtGui, QtCore
-from PyQt6.QtCore import Qt, QRect
-from PyQt6.QtGui import QPainter, QFont, QPixmap
+from PyQt6.QtCore import Qt, QRect, QPoint
+from PyQt6.QtGui import QPainter, QFont, QPixmap, QStaticText
 from PyQt6.QtWidgets import QLabel
 
+from utils.RoiExporter import save_image_atomic
+from utils.ViewTransform import ViewTransform
+
+_font: Optional[QFont] = None  # Шрифт подписей, создается один раз
+_font_metrics: Optional[QtGui.QFontMetrics] = None
+
+
+def labelFont() -> QFont:
+    """Общий шрифт подписей меток"""
+    global _font
+    if _font is None:
+        _font = QFont('Helvetica', 12)
+    return _font
+
+
+def labelMetrics() -> QtGui.QFontMetrics:
+    """Метрики общего шрифта подписей"""
+    global _font_metrics
+    if _font_metrics is None:
+        _font_metrics = QtGui.QFontMetrics(labelFont())
+    return _font_metrics
+
 
 class BoundingBox:
+    __slots__ = ("p0", "p1", "label", "color", "text_bbox", "bbox", "img", "static_text")
+
     def __init__(self, x0: int, y0: int, x1: int, y1: int,
                  label="Новая метка", color=Qt.GlobalColor.green):
         """
-        Класс для реализации метки - выделения области изображения (видео)
+        Класс для реализации метки - выделения области изображения (видео).
+        Углы p0, p1 задаются в пикселях исходного изображения; рамка и подпись bbox, text_bbox
+        рассчитываются при отрисовке в координатах поля вывода.
         """
         self.p0, self.p1 = (x0, y0), (x1, y1)
         self.label: str = label
@@ -20,6 +46,7 @@ class BoundingBox:
         self.text_bbox: Optional[QRect] = None
         self.bbox: Optional[QRect] = None
         self.img: Optional[QPixmap] = None
+        self.static_text: Optional[QStaticText] = None  # Кэш раскладки текста подписи
 
     def __getstate__(self) -> dict:  # Как мы будем "сохранять" класс
         state = {"p0": self.p0,
@@ -34,6 +61,10 @@ class BoundingBox:
         self.p1 = state["p1"]
         self.label = state["label"]
         self.color = state["color"]
+        self.text_bbox = None
+        self.bbox = None
+        self.img = None
+        self.static_text = None
 
     def __str__(self):
         return f"[BoundingBox] Метка {self.label} P0: {self.p0} P1: {self.p1}"
@@ -41,44 +72,68 @@ class BoundingBox:
     def update(self, x1, y1):
         self.p1 = (x1, y1)
 
-    def save(self, path):
-        save_path = os.path.join(path, f"{self.label}.png")
+    def save(self, path, name: Optional[str] = None):
+        """Сохранение вырезанной области в <path>/<name>.png (по умолчанию имя - метка)"""
+        save_path = os.path.join(path, f"{name or self.label}.png")
         print(f"[BoundingBox] Save {self.label} to {save_path}")
         if self.img is not None:
-            self.img.save(save_path)
+            save_image_atomic(self.img.toImage(), save_path)
 
     def set_label(self, label):
         self.label = label
 
     def copy(self):
-        bbox = BoundingBox(*self.p0, *self.p1, label=self.label)
-        bbox.img = self.img.copy()
+        bbox = BoundingBox(*self.p0, *self.p1, label=self.label, color=self.color)
+        bbox.img = self.img.copy() if self.img is not None else None
         return bbox
 
     def get_diag(self):
         return math.sqrt((self.p0[0] - self.p1[0]) ** 2 + (self.p0[1] - self.p1[1]) ** 2)
 
-    def draw(self, imageLabel: QLabel):
-        pixmap = imageLabel.pixmap()
-        painter = QPainter(pixmap)
-        geometry = imageLabel.geometry()
-        painter.setWindow(geometry)
-        font = QFont('Helvetica', 12)
-        painter.setFont(font)
-        font_metrics = QtGui.QFontMetrics(font)
-        painter.setPen(QtGui.QPen(self.color, 4))
+    def image_rect(self) -> QRect:
+        """Область метки в пикселях изображения (правая и нижняя границы не включаются)"""
+        x0, x1 = sorted((self.p0[0], self.p1[0]))
+        y0, y1 = sorted((self.p0[1], self.p1[1]))
+        return QRect(QPoint(x0, y0), QPoint(x1 - 1, y1 - 1))
 
-        x, y, w, h = (min(self.p0[0], self.p1[0]),
-                      min(self.p0[1], self.p1[1]),
-                      abs(self.p0[0] - self.p1[0]),
-                      abs(self.p0[1] - self.p1[1]))
+    def layout(self, font_metrics: QtGui.QFontMetrics, rect: Optional[Tuple[int, int, int, int]] = None):
+        """
+        Расчет геометрии рамки и области текстовой метки (без рисования)
+        :param font_metrics: метрики шрифта подписи
+        :param rect: рамка (x, y, ширина, высота) в координатах рисования (по умолчанию - углы метки как есть)
+        """
+        if rect is None:
+            rect = (min(self.p0[0], self.p1[0]),
+                    min(self.p0[1], self.p1[1]),
+                    abs(self.p0[0] - self.p1[0]),
+                    abs(self.p0[1] - self.p1[1]))
+        x, y, w, h = rect
 
         self.bbox = QtCore.QRect(x, y, w, h)
-        painter.drawRect(self.bbox)
         text_bbox = font_metrics.boundingRect(self.label)
         text_bbox.moveTo(x, y - font_metrics.height())
-        painter.drawRect(text_bbox)
-        self.text_bbox = painter.drawText(text_bbox, 0, self.label)
+        self.text_bbox = text_bbox
+
+    def paint(self, painter: QPainter, rect: Optional[Tuple[int, int, int, int]] = None):
+        """
+        Рисование метки активным QPainter (шрифт labelFont() должен быть выставлен вызывающим)
+        :param painter: QPainter в координатах поля вывода
+        :param rect: рамка в координатах поля (ViewTransform.rectToWidget)
+        """
+        self.layout(labelMetrics(), rect)
+        painter.setPen(QtGui.QPen(self.color, 4))
+        painter.drawRect(self.bbox)
+        painter.drawRect(self.text_bbox)
+        if self.static_text is None or self.static_text.text() != self.label:
+            self.static_text = QStaticText(self.label)  # Раскладка текста кэшируется до смены имени
+        painter.drawStaticText(self.text_bbox.topLeft(), self.static_text)
+
+    def draw(self, imageLabel: QLabel, view: ViewTransform):
+        pixmap = imageLabel.pixmap()
+        painter = QPainter(pixmap)
+        painter.setWindow(view.windowRect())
+        painter.setFont(labelFont())
+        self.paint(painter, view.rectToWidget(self.p0, self.p1))
         painter.end()
         imageLabel.setPixmap(pixmap)
 
@@ -95,13 +150,15 @@ class BoundingBox:
 
     def border_collides(self, x, y):
         """
-        Проверяет попадание точки в область границы метки
-        :param x: координата x
-        :param y: координата y
+        Проверяет попадание точки в область границы метки (по последней рассчитанной рамке)
+        :param x: координата x в координатах поля вывода
+        :param y: координата y в координатах поля вывода
         :return: True, если точка лежит в области границы метки, иначе - False
         """
         eps = 8
-        if self.bbox is not None and self.bbox.contains(x, y):
-            return (abs(x - self.p0[0]) < eps or abs(x - self.p1[0]) < eps
-                    or abs(y - self.p1[1]) < eps or abs(y - self.p1[1]) < eps)
+        if self.bbox is not None and self.bbox.adjusted(-eps, -eps, eps, eps).contains(x, y):
+            left, top = self.bbox.left(), self.bbox.top()
+            right, bottom = left + self.bbox.width(), top + self.bbox.height()
+            return (abs(x - left) < eps or abs(x - right) < eps
+                    or abs(y - top) < eps or abs(y - bottom) < eps)
         return False
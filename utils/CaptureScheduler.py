@@ -0,0 +1,85 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from PyQt6.QtCore import QMutex, QMutexLocker, QSemaphore
+
+
+class CaptureScheduler:
+    """
+    Общий планировщик декодирования для нескольких одновременно открытых источников (сетка камер/видео).
+    Одновременно декодируется не больше slots кадров: один слот закреплен за выбранным (активным)
+    источником, остальные делят фоновые источники. Активный источник показывается в полном темпе,
+    фоновые - не чаще background_fps; непоказываемые кадры фоновых источников пропускаются через
+    grab() без перевода в BGR, уменьшения и отрисовки.
+    """
+
+    def __init__(self, slots: Optional[int] = None, background_fps: float = 5.):
+        self.slots = max(slots or (os.cpu_count() or 2), 2)  # Всего одновременных декодирований
+        self.focused_slot = QSemaphore(1)  # Слот активного источника
+        self.shared_slots = QSemaphore(self.slots - 1)  # Слоты фоновых источников
+        self.background_interval = 1. / background_fps  # Минимальный интервал показа фоновых кадров, с
+        self.mutex = QMutex()
+        self.sources: List[object] = []  # Зарегистрированные потоки кадров
+        self.focused: Optional[object] = None  # Активный поток
+        self.last_shown: Dict[int, float] = {}  # id потока -> момент последнего показанного кадра
+        self.shown = 0  # Кол-во показанных кадров фоновых источников
+        self.throttled = 0  # Кол-во пропущенных кадров фоновых источников
+
+    def register(self, source):
+        with QMutexLocker(self.mutex):
+            self.sources.append(source)
+            if self.focused is None:
+                self.focused = source
+
+    def unregister(self, source):
+        with QMutexLocker(self.mutex):
+            if source in self.sources:
+                self.sources.remove(source)
+            self.last_shown.pop(id(source), None)
+            if self.focused is source:
+                self.focused = self.sources[0] if self.sources else None
+
+    def setFocused(self, source):
+        """Выбор активного источника (показывается в полном темпе)"""
+        with QMutexLocker(self.mutex):
+            self.focused = source
+
+    def decoderThreads(self, sources: int) -> int:
+        """Потоков FFmpeg на один источник, чтобы все источники вместе не превышали число ядер"""
+        return max((os.cpu_count() or 1) // max(sources, 1), 1)
+
+    @contextmanager
+    def slot(self, source):
+        """Слот декодирования (ожидание, если все слоты заняты)"""
+        with QMutexLocker(self.mutex):
+            semaphore = self.focused_slot if source is self.focused else self.shared_slots
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def due(self, source) -> bool:
+        """
+        Нужно ли показать очередной кадр источника
+        :return: True для активного источника и для фонового, если с прошлого показа прошел интервал
+        """
+        now = time.monotonic()
+        with QMutexLocker(self.mutex):
+            if source is self.focused:
+                return True
+            if now - self.last_shown.get(id(source), 0.) < self.background_interval:
+                self.throttled += 1
+                return False
+            self.last_shown[id(source)] = now
+            self.shown += 1
+            return True
+
+    def stats(self) -> dict:
+        with QMutexLocker(self.mutex):
+            return {"slots": self.slots,
+                    "sources": len(self.sources),
+                    "background_shown": self.shown,
+                    "background_throttled": self.throttled}
@@ -0,0 +1,67 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class ChangeDetector:
+    """
+    Детектор изменений сцены (в потоке захвата).
+    Кадр прореживается и уменьшается до миниатюры в оттенках серого, которая сравнивается
+    с миниатюрой последнего показанного кадра: кадр считается изменившимся, если доля пикселей
+    миниатюры с разницей больше threshold превышает min_area. Сравнение идет с показанным кадром,
+    а не с предыдущим, поэтому медленные изменения (освещение) накапливаются и тоже будут показаны.
+    """
+
+    def __init__(self, threshold: int = 12, min_area: float = 0.001, size: Tuple[int, int] = (80, 45),
+                 static_after: int = 15):
+        self.threshold = threshold  # Порог разницы яркости пикселя миниатюры (0-255)
+        self.min_area = min_area  # Минимальная доля изменившихся пикселей миниатюры
+        self.size = size  # Размер миниатюры (ширина, высота)
+        self.static_after = static_after  # Кол-во кадров без изменений, после которого сцена статична
+        self.reference: Optional[np.ndarray] = None  # Миниатюра последнего показанного кадра
+        self.unchanged = 0  # Кол-во кадров подряд без изменений
+        self.static = False  # Сцена статична
+        self.suppressed = 0  # Кол-во неизменившихся (непоказанных) кадров
+        self.changes = 0  # Кол-во переходов статичной сцены в изменяющуюся
+
+    def reset(self):
+        self.reference = None
+        self.unchanged = 0
+        self.static = False
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        step = max(min(w // (self.size[0] * 4), h // (self.size[1] * 4)), 1)  # Прореживание до ~4x миниатюры
+        small = cv2.resize(frame[::step, ::step], self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY if small.shape[2] == 3 else cv2.COLOR_BGRA2GRAY)
+        return small
+
+    def changed(self, frame: np.ndarray, force: bool = False) -> bool:
+        """
+        Проверка кадра
+        :param frame: полноразмерный кадр
+        :param force: кадр показывается в любом случае (перемотка, шаг) - он становится опорным
+        :return: True, если кадр нужно показать
+        """
+        thumbnail = self.thumbnail(frame)
+        if not force and self.reference is not None:
+            moved = np.count_nonzero(cv2.absdiff(thumbnail, self.reference) > self.threshold)
+            if moved <= self.min_area * thumbnail.size:
+                self.suppressed += 1
+                self.unchanged += 1
+                if self.unchanged >= self.static_after:
+                    self.static = True
+                return False
+        if self.static:
+            self.changes += 1
+        self.reference = thumbnail
+        self.unchanged = 0
+        self.static = False
+        return True
+
+    def stats(self) -> dict:
+        return {"static_suppressed": self.suppressed,
+                "scene_changes": self.changes,
+                "scene_static": self.static}
@@ -0,0 +1,172 @@
+"""
+Извлечение видеоклипов всех областей интереса сессии за одно декодирование файла.
+
+Каждый кадр декодируется один раз; области вырезаются из него срезами numpy (без копирования)
+и раздаются нескольким потокам записи через ограниченные каналы FrameQueue с политикой block:
+если кодировщики не успевают, чтение ждет, кадры не теряются. Метки распределяются по потокам
+записи по кругу. Для длинных файлов видео можно разбить на диапазоны кадров по ключевым кадрам
+(индекс utils.SeekIndex) и обработать их в разных процессах - тогда для каждой метки получается
+по клипу на диапазон: <метка>_<первый кадр>.mp4.
+
+Запуск: python -m utils.ClipExtractor <видео> [--session <файл .ssn>] [--output <папка>]
+                                      [--writers N] [--processes N]
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from utils.BatchExport import load_rois
+from utils.FrameQueue import FrameQueue, DropPolicy
+from utils.SeekIndex import SeekIndex
+
+
+class _ClipWriter(threading.Thread):
+    """Поток записи клипов части меток: получает кадры целиком, вырезает свои области и кодирует"""
+
+    def __init__(self, rois: List[Tuple[str, Sequence[int]]], fps: float, fourcc: int, queue_size: int = 4):
+        super().__init__(daemon=True)
+        self.rois = rois  # (путь до клипа, (x0, y0, x1, y1))
+        self.fps = fps
+        self.fourcc = fourcc
+        self.queue = FrameQueue(queue_size, DropPolicy.block)
+        self.writers: List[Optional[cv2.VideoWriter]] = [None] * len(rois)
+        self.frames = 0
+        self.error: Optional[Exception] = None
+
+    def run(self):
+        try:
+            while True:
+                frame = self.queue.get(100)
+                if frame is None:
+                    if self.queue.closed and not len(self.queue):
+                        break
+                    continue
+                self.write(frame)
+        except Exception as e:  # Ошибка передается в основной поток; канал закрывается, чтобы чтение не ждало
+            self.error = e
+            self.queue.close()
+        finally:
+            for writer in self.writers:
+                if writer is not None:
+                    writer.release()
+
+    def write(self, frame: np.ndarray):
+        h, w = frame.shape[:2]
+        for i, (path, (x0, y0, x1, y1)) in enumerate(self.rois):
+            x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+            if x1 - x0 < 2 or y1 - y0 < 2:
+                continue
+            if self.writers[i] is None:
+                self.writers[i] = cv2.VideoWriter(path, self.fourcc, self.fps, (x1 - x0, y1 - y0))
+                if not self.writers[i].isOpened():
+                    raise IOError(f"Can't open writer {path}")
+            self.writers[i].write(frame[y0:y1, x0:x1])  # Срез кадра без копирования
+        self.frames += 1
+
+
+def clip_paths(output_dir: str, names: List[str], start: Optional[int] = None) -> List[str]:
+    suffix = "" if start is None else f"_{start:06d}"
+    return [os.path.join(output_dir, f"{name}{suffix}.mp4") for name in names]
+
+
+def extract_range(video_path: str, rects: np.ndarray, paths: List[str], start: int = 0, end: Optional[int] = None,
+                  writers: int = 4, fourcc: str = "mp4v") -> int:
+    """
+    Извлечение клипов из диапазона кадров за одно декодирование
+    :param video_path: путь до видео
+    :param rects: прямоугольники int[n, 4] (x0, y0, x1, y1) в пикселях кадра
+    :param paths: пути до клипов (по одному на прямоугольник)
+    :param start: первый кадр диапазона
+    :param end: кадр после последнего (None - до конца файла)
+    :param writers: кол-во потоков записи
+    :return: кол-во обработанных кадров
+    """
+    capture = cv2.VideoCapture(video_path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.
+    if start:
+        index = SeekIndex.load(SeekIndex.index_path(video_path), video_path)
+        if index is not None:
+            index.seek(capture, start)  # Точная перемотка: ключевой кадр + пропуск до start
+        else:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    rois = list(zip(paths, rects.tolist()))
+    threads = [_ClipWriter(rois[i::writers], fps, cv2.VideoWriter_fourcc(*fourcc))
+               for i in range(min(writers, len(rois)))]
+    for thread in threads:
+        thread.start()
+    frames = 0
+    try:
+        while end is None or start + frames < end:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            for thread in threads:  # Один и тот же кадр всем потокам записи, без копирования
+                thread.queue.put(frame)
+            frames += 1
+    finally:
+        capture.release()
+        for thread in threads:
+            thread.queue.close()
+        for thread in threads:
+            thread.join()
+    for thread in threads:
+        if thread.error is not None:
+            raise thread.error
+    return frames
+
+
+def split_ranges(index: SeekIndex, parts: int) -> List[Tuple[int, int]]:
+    """Разбиение видео на диапазоны, начинающиеся с ключевых кадров (перемотка к ним не требует пропуска)"""
+    total = len(index)
+    bounds = sorted({0} | {index.keyframe(total * i // parts) for i in range(1, parts)})
+    return list(zip(bounds, bounds[1:] + [total]))
+
+
+def extract_clips(video_path: str, session_path: str, output_dir: str, writers: int = 4,
+                  processes: int = 1) -> Tuple[int, int]:
+    """
+    Извлечение клипов всех меток сессии
+    :return: кол-во клипов (файлов) и кол-во обработанных кадров
+    """
+    rects, names = load_rois(session_path)
+    if not len(rects):
+        return 0, 0
+    os.makedirs(output_dir, exist_ok=True)
+    if processes <= 1:
+        return len(rects), extract_range(video_path, rects, clip_paths(output_dir, names), writers=writers)
+
+    ranges = split_ranges(SeekIndex.open(video_path), processes)
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(extract_range, video_path, rects, clip_paths(output_dir, names, start), start, end,
+                               writers) for start, end in ranges]
+        frames = sum(future.result() for future in futures)
+    return len(rects) * len(ranges), frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Извлечение клипов областей интереса за одно декодирование видео")
+    parser.add_argument("video", help="видео-файл")
+    parser.add_argument("--session", default=None, help="файл сессии (по умолчанию - <видео>.ssn)")
+    parser.add_argument("--output", default=None, help="папка клипов (по умолчанию - <видео>_clips)")
+    parser.add_argument("--writers", type=int, default=4, help="кол-во потоков записи")
+    parser.add_argument("--processes", type=int, default=1, help="кол-во процессов (диапазонов кадров)")
+    args = parser.parse_args(argv)
+
+    stem = os.path.splitext(args.video)[0]
+    session_path = args.session or f"{stem}.ssn"
+    output_dir = args.output or f"{stem}_clips"
+    start = time.perf_counter()
+    clips, frames = extract_clips(args.video, session_path, output_dir, max(args.writers, 1), max(args.processes, 1))
+    print(f"[ClipExtractor] Saved {clips} clips from {frames} frames to {output_dir} "
+          f"in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,72 @@
+import math
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, List, Tuple
+
+from PyQt6.QtCore import QSemaphore
+
+
+class Command(Enum):
+    pause = 0
+    resume = 1
+    seek = 2  # Значение - номер кадра
+    step = 3  # Значение - смещение в кадрах от текущего (или от запрошенного перемоткой) кадра
+    rate = 4  # Значение - скорость воспроизведения
+    stop = 5
+
+
+class CommandChannel:
+    """
+    Канал команд от интерфейса к потоку захвата.
+    Отправка - добавление в deque (атомарно, без блокировок) и освобождение семафора пробуждения,
+    поэтому вызовы из интерфейса не ждут декодирования и паузы между кадрами. Поток захвата
+    забирает все накопившиеся команды между кадрами и ждет на семафоре, когда стоит на паузе
+    или выдерживает темп воспроизведения.
+    """
+
+    def __init__(self):
+        self.commands: Deque[Tuple[Command, Any]] = deque()
+        self.wakeup = QSemaphore(0)  # Сигнал о поступлении команды
+        self.posted = 0  # Кол-во отправленных команд
+
+    def post(self, command: Command, value: Any = None):
+        """Отправка команды (не блокирует)"""
+        self.commands.append((command, value))
+        self.posted += 1
+        self.wakeup.release()
+
+    def drain(self) -> List[Tuple[Command, Any]]:
+        """Все поступившие команды в порядке отправки"""
+        commands = []
+        while True:
+            try:
+                commands.append(self.commands.popleft())
+            except IndexError:
+                return commands
+
+    def wait(self, timeout: float = -1.) -> bool:
+        """
+        Ожидание команды
+        :param timeout: время ожидания, с (отрицательное - без ограничения)
+        :return: True, если поступила команда (ожидание прервано)
+        """
+        deadline = None if timeout < 0 else time.monotonic() + timeout
+        while not self.commands:
+            # Пробуждения от уже забранных команд просто повторяют проверку
+            if deadline is None:
+                self.wakeup.acquire()
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.wakeup.tryAcquire(1, math.ceil(remaining * 1000))
+        return True
+
+    def clear(self):
+        """Сброс команд, не забранных прошлым запуском потока"""
+        self.commands.clear()
+        self.wakeup.tryAcquire(self.wakeup.available())
+
+    def __len__(self):
+        return len(self.commands)
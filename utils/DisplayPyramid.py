@@ -0,0 +1,53 @@
+import math
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.FramePool import FramePool
+
+
+class DisplayPyramid:
+    """
+    Уменьшение кадров для вывода на экран (в потоке захвата).
+    Кадр уменьшается в 2^level раз - до ближайшего уровня пирамиды, который еще не меньше поля вывода;
+    уровни фиксированы, поэтому размер кадров не меняется при каждом изменении размера окна.
+    Полноразмерный кадр при этом сохраняется для вырезки областей интереса.
+    """
+
+    def __init__(self, max_level: int = 4):
+        self.max_level = max_level  # Максимальный уровень (уменьшение в 2^max_level раз)
+        self.view: Tuple[int, int] = (0, 0)  # Размер поля вывода (0 - без уменьшения)
+
+    def setViewSize(self, width: int, height: int):
+        """Размер поля вывода в пикселях экрана (присваивание кортежа атомарно, блокировка не нужна)"""
+        self.view = (int(width), int(height))
+
+    def level(self, width: int, height: int) -> int:
+        """Уровень пирамиды для кадра заданного размера"""
+        view_w, view_h = self.view
+        if view_w <= 0 or view_h <= 0:
+            return 0
+        scale = min(width / view_w, height / view_h)
+        if scale < 2:
+            return 0
+        return min(int(math.log2(scale)), self.max_level)
+
+    def downscale(self, frame: np.ndarray, pool: Optional[FramePool] = None) -> np.ndarray:
+        """
+        Кадр для вывода на экран
+        :param frame: полноразмерный кадр
+        :param pool: пул буферов для уменьшенных кадров (без него кадр выделяется заново)
+        :return: уменьшенный кадр (буфер пула с одной ссылкой у вызывающего) или сам кадр,
+                 если уменьшение не требуется
+        """
+        h, w = frame.shape[:2]
+        level = self.level(w, h)
+        if level == 0:
+            return frame
+        size = (w >> level, h >> level)
+        buffer = pool.acquire((size[1], size[0]) + frame.shape[2:]) if pool is not None else None
+        display = cv2.resize(frame, size, dst=buffer, interpolation=cv2.INTER_AREA)
+        if buffer is not None and display is not buffer:
+            pool.release(buffer)
+        return display
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+import numpy as np
+from PyQt6.QtCore import QMutex, QMutexLocker
+
+
+class FrameCache:
+    """
+    LRU-кэш декодированных кадров с ограничением по объему памяти.
+    Вытеснение идет по байтам, а не по количеству: кадры 4K и превью разного размера
+    честно делят один бюджет. Хранить можно и другие объекты (например, QPixmap тайлов),
+    если при добавлении указан их размер.
+    """
+
+    def __init__(self, budget: int = 256 * 1024 * 1024, release: Optional[Callable[[Any], None]] = None):
+        self.budget = budget  # Максимальный объем кадров в кэше, байт
+        self.release = release  # Вызывается для вытесненных и не принятых кадров (возврат буфера в пул)
+        self.mutex = QMutex()
+        self.frames: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()  # Ключ -> (кадр, размер)
+        self.size = 0  # Текущий объем кадров, байт
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, key):
+        with QMutexLocker(self.mutex):
+            return key in self.frames
+
+    def get(self, key) -> Optional[np.ndarray]:
+        """Кадр из кэша (становится самым свежим) или None"""
+        with QMutexLocker(self.mutex):
+            item = self.frames.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, frame: np.ndarray, nbytes: Optional[int] = None):
+        """
+        Добавление кадра; самые давно использованные кадры вытесняются, пока объем не уложится в бюджет.
+        Кадр хранится без копирования, поэтому после добавления его нельзя изменять.
+        Кэш становится владельцем переданной ссылки и возвращает ее через release при вытеснении.
+        :param nbytes: размер объекта, если это не массив numpy
+        """
+        nbytes = frame.nbytes if nbytes is None else nbytes
+        if nbytes > self.budget:
+            self.discard(frame)
+            return
+        with QMutexLocker(self.mutex):
+            old = self.frames.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+                if old[0] is not frame:
+                    self.discard(old[0])
+            self.frames[key] = (frame, nbytes)
+            self.size += nbytes
+            while self.size > self.budget:
+                self.evict()
+
+    def discard(self, frame):
+        if self.release is not None:
+            self.release(frame)
+
+    def evict(self):
+        """Вытеснение самого давно использованного кадра (вызывается под мьютексом)"""
+        _, evicted = self.frames.popitem(last=False)
+        self.size -= evicted[1]
+        self.evictions += 1
+        self.discard(evicted[0])
+
+    def evictOldest(self) -> bool:
+        """Вытеснение самого давно использованного кадра (освобождение буфера для пула кадров)"""
+        with QMutexLocker(self.mutex):
+            if not self.frames:
+                return False
+            self.evict()
+            return True
+
+    def setBudget(self, budget: int):
+        """Изменение бюджета памяти (с немедленным вытеснением лишнего)"""
+        with QMutexLocker(self.mutex):
+            self.budget = budget
+            while self.size > self.budget and self.frames:
+                self.evict()
+
+    def clear(self):
+        with QMutexLocker(self.mutex):
+            for frame, _ in self.frames.values():
+                self.discard(frame)
+            self.frames.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with QMutexLocker(self.mutex):
+            return {"cached_frames": len(self.frames),
+                    "cache_bytes": self.size,
+                    "cache_hits": self.hits,
+                    "cache_misses": self.misses,
+                    "cache_evictions": self.evictions}
@@ -0,0 +1,77 @@
+from typing import Optional, Callable
+
+import numpy as np
+from PyQt6 import sip
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QImage, QPixmap
+
+from utils.PipelineMetrics import PipelineMetrics, CONVERT
+
+
+# Форматы QImage, совпадающие с раскладкой кадров OpenCV в памяти (конвертация цвета не нужна)
+FRAME_FORMATS = {1: QImage.Format.Format_Grayscale8,
+                 3: QImage.Format.Format_BGR888,
+                 4: QImage.Format.Format_ARGB32}  # BGRA в памяти == ARGB32 на little-endian
+
+
+def frameToImage(frame: np.ndarray, release: Optional[Callable[[np.ndarray], None]] = None) -> QImage:
+    """
+    Оборачивает буфер кадра OpenCV в QImage без копирования и без cvtColor.
+    QImage не копирует пиксели, а удерживает ссылку на массив кадра, пока само изображение живо;
+    при уничтожении изображения вызывается release(frame) (например, для возврата буфера в пул).
+    :param frame: кадр (BGR, BGRA или оттенки серого), допускается срез с произвольным шагом строк
+    :param release: функция освобождения буфера кадра
+    :return: QImage поверх памяти кадра
+    """
+    channels = 1 if frame.ndim == 2 else frame.shape[2]
+    if frame.dtype != np.uint8 or channels not in FRAME_FORMATS:
+        raise ValueError(f"[FrameHub] Unsupported frame: {frame.dtype} {frame.shape}")
+    if frame.strides[1] != channels or (frame.ndim == 3 and frame.strides[2] != 1):
+        frame = np.ascontiguousarray(frame)  # Пиксели строки должны идти подряд, строки - с любым шагом
+    h, w = frame.shape[:2]
+    return QImage(sip.voidptr(frame.ctypes.data), w, h, frame.strides[0], FRAME_FORMATS[channels],
+                  release or _keep, frame)
+
+
+def _keep(frame: np.ndarray):
+    """Освобождение по умолчанию: достаточно отпустить ссылку на кадр"""
+
+
+class FrameHub(QObject):
+    """
+    Раздатчик кадров: каждый кадр видеопотока конвертируется в QPixmap один раз
+    и передается всем подписанным окнам (основное, полноэкранное, дополнительные превью).
+    QPixmap разделяется неявно, поэтому подписчики получают один и тот же кадр без копирования;
+    рисование поверх него копирует данные только у того подписчика, который рисует.
+    """
+    pixmap_signal = pyqtSignal(QPixmap)
+
+    def __init__(self, metrics: Optional[PipelineMetrics] = None):
+        super().__init__()
+        self.pixmap: Optional[QPixmap] = None  # Последний сконвертированный кадр
+        self.metrics = metrics  # Замер времени конвертации (если задан)
+
+    def subscribe(self, slot):
+        """Подписка окна на обновление кадров"""
+        self.pixmap_signal.connect(slot)
+
+    def unsubscribe(self, slot):
+        """Отписка окна от обновления кадров"""
+        try:
+            self.pixmap_signal.disconnect(slot)
+        except TypeError:
+            print("[FrameHub] Slot is not subscribed")
+
+    @pyqtSlot(np.ndarray)
+    def updateFrame(self, frame):
+        """
+        Конвертация кадра и рассылка подписчикам
+        :param frame: кадр в формате BGR
+        """
+        start = PipelineMetrics.now()
+        q_image = frameToImage(frame)  # Удерживает буфер декодера, пока существует
+        self.pixmap = QPixmap.fromImage(q_image)  # Единственное копирование кадра
+        del q_image  # Пиксели уже в QPixmap, буфер декодера можно освободить
+        if self.metrics is not None:
+            self.metrics.record(CONVERT, start)
+        self.pixmap_signal.emit(self.pixmap)
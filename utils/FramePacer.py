@@ -0,0 +1,102 @@
+import math
+import time
+from collections import deque
+from typing import Deque, Optional
+
+
+class FramePacer:
+    """
+    Планировщик вывода кадров по монотонным часам.
+    Время показа кадра вычисляется от его метки времени в источнике, а не накапливается
+    из фиксированных пауз, поэтому время декодирования и отрисовки не замедляет воспроизведение.
+    """
+
+    def __init__(self, fps: float, enabled: bool = True, window: int = 120, max_late: int = 8):
+        self.fps = fps if fps and fps > 0 and not math.isnan(fps) else 30.
+        self.interval = 1. / self.fps  # Интервал между кадрами, с
+        self.enabled = enabled  # Для камер темп задает само устройство, ожидание не нужно
+        self.rate = 1.  # Скорость воспроизведения
+        self.origin_clock: Optional[float] = None  # Момент показа опорного кадра
+        self.origin_pts: Optional[float] = None  # Метка времени опорного кадра, с
+        self.last_pts: Optional[float] = None
+        self.skipped = 0  # Кол-во опозданий, после которых кадры пропускались для догона
+        self.late_streak = 0  # Кол-во опоздавших подряд кадров
+        self.max_late = max_late  # После стольких опозданий подряд отсчет времени начинается заново
+        self.presented: Deque[float] = deque(maxlen=window)  # Моменты показа последних кадров
+
+    def reset(self):
+        """Сброс опорной точки (после паузы или перемотки)"""
+        self.origin_clock = None
+        self.origin_pts = None
+        self.last_pts = None
+        self.late_streak = 0
+
+    def setRate(self, rate: float):
+        """Скорость воспроизведения (отсчет времени начинается заново со следующего кадра)"""
+        self.rate = rate
+        self.reset()
+
+    def timestamp(self, pts_ms: float) -> float:
+        """
+        Нормализует метку времени кадра
+        :param pts_ms: метка времени из источника (CAP_PROP_POS_MSEC), мс
+        :return: метка времени в секундах; если источник не дает возрастающих меток - расчетная по fps
+        """
+        pts = pts_ms / 1000.
+        if self.last_pts is not None and pts <= self.last_pts:
+            pts = self.last_pts + self.interval
+        self.last_pts = pts
+        return pts
+
+    def delay(self, pts: float) -> float:
+        """
+        Время до показа кадра
+        :param pts: метка времени кадра, с
+        :return: задержка в секундах (отрицательная, если кадр опаздывает)
+        """
+        now = time.monotonic()
+        if self.origin_clock is None:
+            self.origin_clock, self.origin_pts = now, pts
+        return self.origin_clock + (pts - self.origin_pts) / self.rate - now
+
+    def late(self, delay: float) -> bool:
+        """
+        Кадр опаздывает больше, чем на интервал между кадрами, и отставание следует догнать пропуском кадров.
+        Если кадры опаздывают max_late раз подряд (декодирование медленнее источника), расписание
+        недостижимо: отсчет начинается заново от текущего кадра, и он не считается опоздавшим.
+        """
+        if not self.enabled or delay >= -self.interval / self.rate:
+            self.late_streak = 0
+            return False
+        self.late_streak += 1
+        if self.late_streak >= self.max_late:
+            self.reset()
+            return False
+        self.skipped += 1
+        return True
+
+    def present(self):
+        """Фиксирует момент показа кадра для статистики (вызывается в потоке интерфейса при доставке кадра)"""
+        self.presented.append(time.monotonic())
+
+    def achieved_fps(self) -> float:
+        """Фактическая частота показа кадров по последним кадрам"""
+        if len(self.presented) < 2:
+            return 0.
+        span = self.presented[-1] - self.presented[0]
+        return (len(self.presented) - 1) / span if span > 0 else 0.
+
+    def jitter(self) -> float:
+        """Разброс интервалов между показами кадров (стандартное отклонение), мс"""
+        if len(self.presented) < 3:
+            return 0.
+        stamps = list(self.presented)
+        intervals = [b - a for a, b in zip(stamps, stamps[1:])]
+        mean = sum(intervals) / len(intervals)
+        return 1000. * math.sqrt(sum((i - mean) ** 2 for i in intervals) / len(intervals))
+
+    def stats(self) -> dict:
+        return {"source_fps": self.fps,
+                "achieved_fps": self.achieved_fps(),
+                "jitter_ms": self.jitter(),
+                "skipped": self.skipped}
@@ -0,0 +1,103 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PyQt6.QtCore import QMutex, QMutexLocker
+
+
+class FramePool:
+    """
+    Пул заранее выделенных буферов кадров, в которые декодер читает кадры (capture.read(image=buffer)).
+    Владение буфером учитывается явно: acquire() выдает буфер с одной ссылкой (у декодера), каждый потребитель,
+    которому кадр передается надолго (канал кадров, кэш, запись, последний показанный кадр), берет свою ссылку
+    через retain() и возвращает ее через release(), когда кадр больше не нужен. Буфер снова выдается декодеру
+    только после возврата всех ссылок. В установившемся режиме воспроизведения новые кадры не выделяются.
+    """
+
+    def __init__(self, budget: int = 0, spare: int = 6, reclaim: Optional[Callable[[], bool]] = None):
+        self.budget = budget  # Объем кадров, которые могут удерживаться надолго (кэш), байт
+        self.spare = spare  # Буферов сверх бюджета - кадры в пути (канал, вывод, запись)
+        self.reclaim = reclaim  # Освобождение самого старого удерживаемого кадра (вытеснение из кэша)
+        self.mutex = QMutex()
+        self.shape: Optional[Tuple[int, ...]] = None  # Форма кадров, для которых выдаются буферы
+        self.holds: Dict[int, list] = {}  # id буфера -> [буфер, кол-во ссылок]
+        self.free: List[np.ndarray] = []  # Свободные буферы текущей формы
+        self.allocated = 0  # Кол-во выделенных буферов
+        self.reused = 0  # Кол-во повторных использований
+        self.exhausted = 0  # Кол-во кадров, для которых не нашлось буфера (выделены вне пула)
+
+    def capacity(self, shape: Tuple[int, ...]) -> int:
+        return self.budget // max(int(np.prod(shape)), 1) + self.spare
+
+    def take(self, shape: Tuple[int, ...]) -> Optional[np.ndarray]:
+        """Свободный или новый буфер (вызывается под мьютексом)"""
+        if shape != self.shape:  # Источник сменил разрешение - свободные буферы старой формы не понадобятся
+            self.shape = shape
+            for buffer in self.free:
+                del self.holds[id(buffer)]
+            self.free.clear()
+        if self.free:
+            buffer = self.free.pop()
+            self.holds[id(buffer)][1] = 1
+            self.reused += 1
+            return buffer
+        if len(self.holds) < self.capacity(shape):
+            buffer = np.empty(shape, dtype=np.uint8)
+            self.holds[id(buffer)] = [buffer, 1]
+            self.allocated += 1
+            return buffer
+        return None
+
+    def acquire(self, shape: Tuple[int, ...]) -> Optional[np.ndarray]:
+        """
+        Свободный буфер для кадра (с одной ссылкой у вызывающего, вернуть через release())
+        :param shape: форма кадра (высота, ширина, каналы)
+        :return: буфер или None, если пул исчерпан (тогда кадр выделяется обычным способом)
+        """
+        while True:
+            with QMutexLocker(self.mutex):
+                buffer = self.take(shape)
+            if buffer is not None:
+                return buffer
+            # Вытеснение выполняется без блокировки пула: кэш возвращает буфер через release()
+            if self.reclaim is None or not self.reclaim():
+                with QMutexLocker(self.mutex):
+                    self.exhausted += 1
+                return None
+
+    def retain(self, frame: Optional[np.ndarray]):
+        """Дополнительная ссылка на буфер (кадры, выделенные вне пула, не учитываются)"""
+        if frame is None:
+            return
+        with QMutexLocker(self.mutex):
+            hold = self.holds.get(id(frame))
+            if hold is not None and hold[0] is frame:
+                hold[1] += 1
+
+    def release(self, frame: Optional[np.ndarray]):
+        """Возврат ссылки на буфер; после возврата последней буфер снова свободен"""
+        if frame is None:
+            return
+        with QMutexLocker(self.mutex):
+            hold = self.holds.get(id(frame))
+            if hold is None or hold[0] is not frame or hold[1] <= 0:
+                return
+            hold[1] -= 1
+            if hold[1]:
+                return
+            if frame.shape == self.shape:
+                self.free.append(frame)
+            else:
+                del self.holds[id(frame)]
+
+    def clear(self):
+        with QMutexLocker(self.mutex):
+            self.holds.clear()
+            self.free.clear()
+
+    def stats(self) -> dict:
+        with QMutexLocker(self.mutex):
+            return {"pool_buffers": len(self.holds),
+                    "pool_in_use": len(self.holds) - len(self.free),
+                    "pool_allocated": self.allocated,
+                    "pool_reused": self.reused,
+                    "pool_exhausted": self.exhausted}
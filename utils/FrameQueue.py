@@ -0,0 +1,119 @@
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Optional
+
+from PyQt6.QtCore import QMutex, QWaitCondition, QMutexLocker
+
+
+class DropPolicy(Enum):
+    latest = 0  # Хранится только последний кадр
+    drop_oldest = 1  # При переполнении выбрасывается самый старый кадр
+    block = 2  # При переполнении производитель ждет освобождения места
+
+
+class FrameQueue:
+    """
+    Ограниченный канал кадров между видеопотоком и интерфейсом.
+    Не дает кадрам копиться в очереди событий Qt, если отрисовка не успевает за захватом.
+    """
+
+    def __init__(self, maxsize: int = 2, policy: DropPolicy = DropPolicy.latest,
+                 discard: Optional[Callable[[Any], None]] = None):
+        self.policy = policy
+        self.discard = discard  # Вызывается для выброшенных кадров (возврат буферов в пул)
+        self.maxsize = 1 if policy == DropPolicy.latest else max(1, maxsize)
+        self.mutex = QMutex()  # Блокировщик очереди
+        self.not_full = QWaitCondition()  # Условие появления места (для политики block)
+        self.not_empty = QWaitCondition()  # Условие появления кадра (для потребителя с ожиданием)
+        self.items: Deque[Any] = deque()
+        self.closed = False
+        self.put_count = 0  # Кол-во поступивших кадров
+        self.get_count = 0  # Кол-во выданных кадров
+        self.dropped = 0  # Кол-во выброшенных кадров
+
+    def put(self, item) -> bool:
+        """
+        Помещает кадр в очередь согласно политике переполнения
+        :param item: кадр
+        :return: True, если очередь была пуста и потребителя нужно уведомить, иначе - False
+        """
+        with QMutexLocker(self.mutex):
+            if self.closed:
+                self.drop(item)
+                return False
+            self.put_count += 1
+            if len(self.items) >= self.maxsize:
+                if self.policy == DropPolicy.block:
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.not_full.wait(self.mutex)
+                    if self.closed:
+                        self.drop(item)
+                        return False
+                else:
+                    self.drop(self.items.popleft())
+            was_empty = not self.items
+            self.items.append(item)
+            self.not_empty.wakeOne()
+            return was_empty
+
+    def get(self, timeout: int = 0) -> Optional[Any]:
+        """
+        Забирает кадр из очереди
+        :param timeout: время ожидания кадра, мс (0 - без ожидания; для потребителя в отдельном потоке)
+        :return: кадр или None, если очередь пуста
+        """
+        with QMutexLocker(self.mutex):
+            if not self.items and timeout and not self.closed:
+                self.not_empty.wait(self.mutex, timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.get_count += 1
+            self.not_full.wakeOne()
+            return item
+
+    def drop(self, item):
+        """Учет выброшенного кадра (вызывается под мьютексом)"""
+        self.dropped += 1
+        if self.discard is not None:
+            self.discard(item)
+
+    def setMaxsize(self, maxsize: int):
+        """Изменение емкости канала (при политике drop_oldest лишние старые кадры выбрасываются сразу)"""
+        with QMutexLocker(self.mutex):
+            if self.policy == DropPolicy.latest:
+                return
+            self.maxsize = max(1, maxsize)
+            while self.policy == DropPolicy.drop_oldest and len(self.items) > self.maxsize:
+                self.drop(self.items.popleft())
+            self.not_full.wakeAll()
+
+    def clear(self):
+        with QMutexLocker(self.mutex):
+            while self.items:
+                self.drop(self.items.popleft())
+            self.not_full.wakeAll()
+
+    def close(self):
+        """Закрытие канала, пробуждает заблокированного производителя"""
+        with QMutexLocker(self.mutex):
+            self.closed = True
+            self.not_full.wakeAll()
+            self.not_empty.wakeAll()
+
+    def reopen(self):
+        with QMutexLocker(self.mutex):
+            self.closed = False
+
+    def __len__(self):
+        with QMutexLocker(self.mutex):
+            return len(self.items)
+
+    def stats(self) -> dict:
+        """Счетчики канала кадров"""
+        with QMutexLocker(self.mutex):
+            return {"policy": self.policy.name,
+                    "depth": len(self.items),
+                    "put": self.put_count,
+                    "delivered": self.get_count,
+                    "dropped": self.dropped}
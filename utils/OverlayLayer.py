@@ -0,0 +1,76 @@
+from typing import Optional
+
+from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtGui import QPainter, QPixmap
+
+from utils.BoundingBox import BoundingBox, labelFont
+from utils.RoiStore import RoiStore
+from utils.ViewTransform import ViewTransform
+
+
+class OverlayLayer:
+    """
+    Слой меток поверх кадра.
+    Все рамки рисуются в отдельный прозрачный QPixmap, который перерисовывается только при
+    изменении набора меток или геометрии вывода; на каждом кадре слой накладывается за один проход.
+    Метки хранятся в пикселях изображения и переводятся в координаты поля вывода все сразу,
+    поэтому рамки совпадают с изображением при любом масштабе, а подписи имеют экранный размер.
+    """
+
+    def __init__(self):
+        self.pixmap: Optional[QPixmap] = None  # Отрисованные метки
+        self.size: Optional[QSize] = None  # Размер кадра, под который отрисован слой
+        self.view: Optional[ViewTransform] = None  # Преобразование, для которого отрисован слой
+        self.version = -1  # Номер этого преобразования
+        self.count = 0  # Кол-во меток в слое
+        self.revision = -1  # Номер изменения хранилища меток, по которому отрисован слой
+        self.dirty = True  # Флаг необходимости перерисовки
+
+    def invalidate(self):
+        """Пометить слой для перерисовки (метка добавлена, переименована или удалена)"""
+        self.dirty = True
+
+    def render(self, bboxes: RoiStore, size: QSize, view: ViewTransform):
+        """
+        Перерисовка слоя, если он устарел
+        :param bboxes: метки
+        :param size: размер кадра
+        :param view: преобразование пикселей изображения в координаты поля вывода
+        """
+        if not self.dirty and self.size == size and self.view is view and self.version == view.version \
+                and self.revision == bboxes.revision:
+            return
+        self.pixmap = QPixmap(size)
+        self.pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(self.pixmap)
+        painter.setWindow(view.windowRect())
+        painter.setFont(labelFont())
+        bboxes.paint(painter, view)
+        self.count = len(bboxes)
+        painter.end()
+        self.size, self.view, self.version, self.revision = QSize(size), view, view.version, bboxes.revision
+        self.dirty = False
+
+    def composite(self, frame: QPixmap, bboxes: RoiStore, view: ViewTransform,
+                  active: Optional[BoundingBox] = None) -> QPixmap:
+        """
+        Наложение слоя меток на кадр
+        :param frame: кадр (не изменяется - он может быть общим для нескольких окон)
+        :param bboxes: метки
+        :param view: преобразование пикселей изображения в координаты поля вывода
+        :param active: рисуемая в данный момент метка (в слой не кэшируется)
+        :return: кадр с метками
+        """
+        self.render(bboxes, frame.size(), view)
+        if self.count == 0 and active is None:
+            return frame
+        result = QPixmap(frame)
+        painter = QPainter(result)
+        if self.count:
+            painter.drawPixmap(0, 0, self.pixmap)
+        if active is not None:
+            painter.setWindow(view.windowRect())
+            painter.setFont(labelFont())
+            active.paint(painter, view.rectToWidget(active.p0, active.p1))
+        painter.end()
+        return result
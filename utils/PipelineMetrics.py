@@ -0,0 +1,148 @@
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from PyQt6.QtCore import QMutex, QMutexLocker
+
+# Этапы конвейера кадров в порядке прохождения
+DECODE = "decode"  # capture.read() в потоке захвата
+DOWNSCALE = "downscale"  # Уменьшение кадра до поля вывода
+QUEUE = "queue"  # От помещения в канал до извлечения в потоке интерфейса (включая доставку сигнала)
+CONVERT = "convert"  # Кадр -> QPixmap в FrameHub
+OVERLAY = "overlay"  # Наложение меток
+PAINT = "paint"  # Отрисовка поля вывода
+TOTAL = "total"  # От начала декодирования до вывода кадра с метками
+STAGES = (DECODE, DOWNSCALE, QUEUE, CONVERT, OVERLAY, PAINT, TOTAL)
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами (от 10 мкс до ~20 с, шаг 10%).
+    Запись - поиск корзины и инкремент счетчика, память постоянна; перцентили считаются
+    с точностью до ширины корзины.
+    """
+    BOUNDS: List[float] = []  # Верхние границы корзин, с
+
+    def __init__(self):
+        if not LatencyHistogram.BOUNDS:
+            bound = 1e-5
+            while bound < 20.:
+                LatencyHistogram.BOUNDS.append(bound)
+                bound *= 1.1
+        self.counts = [0] * (len(self.BOUNDS) + 1)  # Последняя корзина - все, что больше
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """
+        Перцентиль задержки
+        :param q: доля от 0 до 1 (0.95 - p95)
+        :return: верхняя граница корзины, с (не больше максимальной записанной задержки)
+        """
+        if not self.count:
+            return 0.
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def stats(self) -> dict:
+        """Кол-во замеров, среднее, p50/p95/p99 и максимум, мс"""
+        return {"count": self.count,
+                "mean_ms": 1000. * self.total / self.count if self.count else 0.,
+                "p50_ms": 1000. * self.percentile(.5),
+                "p95_ms": 1000. * self.percentile(.95),
+                "p99_ms": 1000. * self.percentile(.99),
+                "max_ms": 1000. * self.max}
+
+
+class PipelineMetrics:
+    """
+    Метрики конвейера кадров: гистограммы задержек по этапам и текущие значения (глубина канала).
+    Замеры пишутся из потока захвата и потока интерфейса; запись стоит два вызова perf_counter
+    и инкремент счетчика под мьютексом, поэтому инструментирование включено всегда.
+    """
+
+    def __init__(self):
+        self.mutex = QMutex()
+        self.stages: Dict[str, LatencyHistogram] = {stage: LatencyHistogram() for stage in STAGES}
+        self.gauges: Dict[str, float] = {}  # Последние значения
+        self.peaks: Dict[str, float] = {}  # Максимальные значения
+
+    @staticmethod
+    def now() -> float:
+        """Отметка времени для замеров (монотонные часы высокого разрешения), с"""
+        return time.perf_counter()
+
+    def record(self, stage: str, start: float, end: Optional[float] = None):
+        """
+        Запись длительности этапа
+        :param stage: этап (одна из констант модуля или собственное имя)
+        :param start: отметка начала (PipelineMetrics.now())
+        :param end: отметка конца (по умолчанию - текущий момент)
+        """
+        elapsed = (self.now() if end is None else end) - start
+        with QMutexLocker(self.mutex):
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.record(elapsed)
+
+    def gauge(self, name: str, value: float):
+        """Текущее значение величины (например, глубины канала) с запоминанием пика"""
+        with QMutexLocker(self.mutex):
+            self.gauges[name] = value
+            self.peaks[name] = max(self.peaks.get(name, value), value)
+
+    def reset(self):
+        with QMutexLocker(self.mutex):
+            self.stages = {stage: LatencyHistogram() for stage in STAGES}
+            self.gauges.clear()
+            self.peaks.clear()
+
+    def stats(self) -> dict:
+        """
+        Снимок метрик
+        :return: {"stages": {этап: статистика гистограммы}, "gauges": {...}, "peaks": {...}}
+        """
+        with QMutexLocker(self.mutex):
+            return {"stages": {stage: histogram.stats() for stage, histogram in self.stages.items()},
+                    "gauges": dict(self.gauges),
+                    "peaks": dict(self.peaks)}
+
+
+def formatStats(stats: dict) -> str:
+    """Текстовое представление статистики VideoThread.stats() для вывода на экран"""
+    lines = []
+    if "achieved_fps" in stats:
+        lines.append(f"fps {stats['achieved_fps']:5.1f}/{stats['source_fps']:.1f}  "
+                     f"jitter {stats['jitter_ms']:.1f} ms  rate {stats.get('rate', 1.):g}x")
+    if "depth" in stats:
+        lines.append(f"queue {stats['depth']} ({stats['policy']})  "
+                     f"dropped {stats['dropped']}  skipped {stats.get('skipped', 0)}  grabbed {stats.get('grabbed', 0)}")
+    if "pool_buffers" in stats:
+        lines.append(f"buffers {stats['pool_in_use']}/{stats['pool_buffers']}  "
+                     f"reused {stats['pool_reused']}  allocated {stats['pool_allocated'] + stats['pool_exhausted']}")
+    if "static_suppressed" in stats:
+        lines.append(f"static {'yes' if stats['scene_static'] else 'no'}  suppressed {stats['static_suppressed']}  "
+                     f"changes {stats['scene_changes']}")
+    if "recorded" in stats:
+        lines.append(f"rec {stats['recorded']}  dropped {stats['record_dropped']}  "
+                     f"peak queue {stats['record_peak_depth']}")
+    lines.append(f"{'stage':<10}{'p50':>8}{'p95':>8}{'p99':>8}{'n':>8}")
+    for stage, histogram in stats.get("stages", {}).items():
+        if histogram["count"]:
+            lines.append(f"{stage:<10}{histogram['p50_ms']:8.2f}{histogram['p95_ms']:8.2f}"
+                         f"{histogram['p99_ms']:8.2f}{histogram['count']:8d}")
+    return "\n".join(lines)
@@ -0,0 +1,127 @@
+import os
+import tempfile
+from typing import Iterable, List, Optional
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QMutex, QMutexLocker, pyqtSignal
+from PyQt6.QtGui import QImage
+
+UMASK = os.umask(0o022)  # Права создаваемых файлов (mkstemp создает временный файл с правами 0600)
+os.umask(UMASK)
+
+
+def save_image_atomic(image: QImage, path: str) -> bool:
+    """
+    Сохранение изображения через временный файл и атомарное переименование:
+    при сбое на диске остается либо старый файл, либо полностью записанный новый.
+    Временный файл уникален, поэтому параллельные записи не смешиваются.
+    :param image: изображение
+    :param path: путь до PNG-файла
+    :return: True, если файл записан
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    os.close(fd)
+    try:
+        if not image.save(tmp_path, "PNG"):
+            return False
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def unique_names(labels: Iterable[str]) -> List[str]:
+    """Имена файлов для меток: одинаковые метки получают суффикс _N и не перезаписывают друг друга"""
+    names, seen = [], {}
+    for label in labels:
+        seen[label] = seen.get(label, 0) + 1
+        names.append(label if seen[label] == 1 else f"{label}_{seen[label] - 1}")
+    return names
+
+
+class _ExportTask(QRunnable):
+    """Задача сохранения одной области интереса"""
+
+    def __init__(self, exporter: "RoiExporter", image: QImage, path: str):
+        super().__init__()
+        self.exporter = exporter
+        self.image = image
+        self.path = path
+
+    def run(self):
+        ok = None  # None - задача отменена
+        try:
+            if not self.exporter.cancelled:
+                ok = save_image_atomic(self.image, self.path)
+        except OSError as e:
+            ok = False
+            print(f"[RoiExporter] {e}")
+        finally:  # Задача учитывается при любом исходе, иначе сигнал завершения не придет
+            self.exporter.taskDone(self.path, ok)
+
+
+class RoiExporter(QObject):
+    """
+    Фоновое сохранение областей интереса в пуле потоков.
+    Кодирование PNG не выполняется в потоке интерфейса, поэтому окно закрывается сразу.
+    """
+    progress_signal = pyqtSignal(int, int)  # Обработано, всего
+    finish_signal = pyqtSignal(int, int)  # Сохранено, не сохранено (ошибка или отмена)
+
+    def __init__(self, threads: Optional[int] = None):
+        super().__init__()
+        self.pool = QThreadPool()
+        if threads is not None:
+            self.pool.setMaxThreadCount(threads)
+        self.mutex = QMutex()
+        self.cancelled = False  # Флаг отмены
+        self.total = 0  # Кол-во поставленных задач
+        self.done = 0  # Кол-во обработанных задач
+        self.saved = 0  # Кол-во сохраненных файлов
+
+    def export(self, bboxes: Iterable, path: str):
+        """
+        Постановка меток на сохранение (вызывается из потока интерфейса: QPixmap переводится в QImage здесь)
+        :param bboxes: метки utils.BoundingBox.BoundingBox
+        :param path: папка сохранения
+        """
+        self.cancelled = False
+        bboxes = [bbox for bbox in bboxes if bbox.img is not None]
+        tasks = []
+        for bbox, name in zip(bboxes, unique_names(bbox.label for bbox in bboxes)):
+            save_path = os.path.join(path, f"{name}.png")
+            print(f"[RoiExporter] Save {bbox.label} to {save_path}")
+            tasks.append(_ExportTask(self, bbox.img.toImage(), save_path))
+        with QMutexLocker(self.mutex):  # Всего задач учитывается до запуска, чтобы не завершиться досрочно
+            idle = self.done == self.total
+            if idle:  # Счетчики - по текущему сохранению (задачи еще не завершенного учитываются вместе с ним)
+                self.total = self.done = self.saved = 0
+            self.total += len(tasks)
+        if not tasks:
+            if idle:  # Сохранять нечего и предыдущих задач нет - завершение сразу, иначе его сообщат они
+                self.finish_signal.emit(0, 0)
+            return
+        for task in tasks:
+            self.pool.start(task)
+
+    def taskDone(self, path: str, ok: Optional[bool]):
+        """Учет завершенной задачи (вызывается из рабочих потоков)"""
+        if ok is False:
+            print(f"[RoiExporter] Failed to save {path}")
+        with QMutexLocker(self.mutex):
+            self.done += 1
+            self.saved += bool(ok)
+            done, total, saved = self.done, self.total, self.saved
+        self.progress_signal.emit(done, total)
+        if done == total:
+            self.finish_signal.emit(saved, total - saved)
+
+    def cancel(self):
+        """Отмена сохранения: еще не начатые задачи пропускаются, начатые дописываются до конца"""
+        self.cancelled = True
+
+    def wait(self, msecs: int = -1) -> bool:
+        """Ожидание завершения всех задач"""
+        return self.pool.waitForDone(msecs)
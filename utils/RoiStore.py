@@ -0,0 +1,334 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from PyQt6 import QtGui
+from PyQt6.QtCore import Qt, QRect, QPointF
+from PyQt6.QtGui import QPainter, QPixmap, QStaticText
+
+from utils.BoundingBox import BoundingBox, labelMetrics
+from utils.SpatialIndex import SpatialIndex
+from utils.ViewTransform import ViewTransform
+
+BORDER = "border"  # Попадание в рамку
+LABEL = "label"  # Попадание в подпись
+
+
+class RoiProxy(BoundingBox):
+    """
+    Легковесная ссылка на метку в RoiStore с интерфейсом BoundingBox: координаты, имя, цвет
+    и вырезанная область читаются из массивов хранилища и записываются в них.
+    Создается при обращении и не хранится; сравнение идет по идентификатору метки.
+    К унаследованным слотам BoundingBox добавляются хранилище и идентификатор; из унаследованных
+    заполняются только кэши отрисовки (пустыми), остальные поля - свойства поверх массивов хранилища.
+    """
+    __slots__ = ("store", "id")
+
+    def __init__(self, store: "RoiStore", roi_id: int):
+        self.store = store
+        self.id = roi_id
+        self.text_bbox = None
+        self.bbox = None
+        self.static_text = None
+
+    def __eq__(self, other):
+        return isinstance(other, RoiProxy) and other.store is self.store and other.id == self.id
+
+    def __hash__(self):
+        return hash((id(self.store), self.id))
+
+    def __reduce__(self):  # Сохраняется как самостоятельная метка
+        return BoundingBox, (*self.p0, *self.p1, self.label, self.color)
+
+    @property
+    def p0(self) -> Tuple[int, int]:
+        x0, y0 = self.store.coords[self.store.row(self.id), :2].tolist()
+        return x0, y0
+
+    @p0.setter
+    def p0(self, point: Tuple[int, int]):
+        self.store.set_coords(self.id, point, self.p1)
+
+    @property
+    def p1(self) -> Tuple[int, int]:
+        x1, y1 = self.store.coords[self.store.row(self.id), 2:].tolist()
+        return x1, y1
+
+    @p1.setter
+    def p1(self, point: Tuple[int, int]):
+        self.store.set_coords(self.id, self.p0, point)
+
+    @property
+    def label(self) -> str:
+        return self.store.labels[self.store.label_ids[self.store.row(self.id)]]
+
+    @label.setter
+    def label(self, label: str):
+        self.store.rename(self, label)
+
+    @property
+    def color(self) -> Qt.GlobalColor:
+        return Qt.GlobalColor(int(self.store.colors[self.store.row(self.id)]))
+
+    @color.setter
+    def color(self, color: Qt.GlobalColor):
+        self.store.colors[self.store.row(self.id)] = color.value
+        self.store.revision += 1
+
+    @property
+    def img(self) -> Optional[QPixmap]:
+        return self.store.images.get(self.id)
+
+    @img.setter
+    def img(self, img: Optional[QPixmap]):
+        if img is None:
+            self.store.images.pop(self.id, None)
+        else:
+            self.store.images[self.id] = img
+
+
+class RoiStore:
+    """
+    Хранилище меток в виде структуры массивов: углы int32[n, 4] (x0, y0, x1, y1) в пикселях
+    изображения, цвета uint32[n] и номера имен int32[n] в таблице уникальных имен.
+    Массовые операции (перевод в координаты поля, отрисовка, поиск по клику, сохранение) идут
+    по массивам без создания объектов; для совместимости с кодом, работающим с BoundingBox,
+    хранилище ведет себя как последовательность RoiProxy. Порядок меток - z-порядок отрисовки.
+    Вырезанные области (QPixmap) есть только у меток, выделенных вручную, и хранятся отдельно.
+    """
+
+    def __init__(self, capacity: int = 16):
+        self.count = 0  # Кол-во меток
+        self.coords = np.zeros((capacity, 4), dtype=np.int32)
+        self.colors = np.zeros(capacity, dtype=np.uint32)
+        self.label_ids = np.zeros(capacity, dtype=np.int32)
+        self.ids = np.zeros(capacity, dtype=np.int64)  # Идентификаторы меток (возрастают в z-порядке)
+        self.next_id = 0
+        self.labels: List[str] = []  # Таблица уникальных имен
+        self.label_index: Dict[str, int] = {}
+        self.images: Dict[int, QPixmap] = {}  # Идентификатор -> вырезанная область
+        self.revision = 0  # Счетчик изменений (для кэшей, построенных по меткам)
+        self.texts: Dict[int, QStaticText] = {}  # Раскладка подписей по номеру имени
+        self.text_sizes = np.zeros((0, 2), dtype=np.int32)  # Размер подписи (ширина, высота) по номеру имени
+        self.cached_layout: Optional[Tuple[tuple, np.ndarray, np.ndarray]] = None  # Рамки и подписи на поле
+        self.index: Optional[Tuple[tuple, SpatialIndex]] = None  # Индекс поиска по клику и его ключ
+        self.stale: Set[int] = set()  # Идентификаторы меток, измененных после обновления индекса
+        self.identity = ViewTransform()  # Преобразование по умолчанию: координаты поля совпадают с пикселями
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self) -> Iterator[RoiProxy]:
+        for roi_id in self.ids[:self.count].tolist():
+            yield RoiProxy(self, roi_id)
+
+    def __getitem__(self, index: int) -> RoiProxy:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("[RoiStore] Index out of range")
+        return RoiProxy(self, int(self.ids[index]))
+
+    @property
+    def nbytes(self) -> int:
+        """Объем массивов меток, байт (без вырезанных областей)"""
+        return self.coords.nbytes + self.colors.nbytes + self.label_ids.nbytes + self.ids.nbytes
+
+    def row(self, roi_id: int) -> int:
+        """Строка метки в массивах по идентификатору"""
+        row = int(np.searchsorted(self.ids[:self.count], roi_id))
+        if row >= self.count or self.ids[row] != roi_id:
+            raise ValueError(f"[RoiStore] No ROI with id {roi_id}")
+        return row
+
+    def intern(self, label: str) -> int:
+        """Номер имени в таблице имен (новое имя добавляется)"""
+        label_id = self.label_index.get(label)
+        if label_id is None:
+            label_id = self.label_index[label] = len(self.labels)
+            self.labels.append(label)
+        return label_id
+
+    def reserve(self, capacity: int):
+        if capacity <= len(self.ids):
+            return
+        capacity = max(capacity, 2 * len(self.ids))
+        for name in ("coords", "colors", "label_ids", "ids"):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.count] = array[:self.count]
+            setattr(self, name, grown)
+
+    def extend(self, coords: np.ndarray, colors: np.ndarray, labels: Sequence[str]):
+        """
+        Добавление меток массивами (поверх существующих)
+        :param coords: углы int[n, 4] (x0, y0, x1, y1) в пикселях изображения
+        :param colors: цвета Qt.GlobalColor в виде чисел uint[n]
+        :param labels: имена меток
+        """
+        n = len(labels)
+        start, end = self.count, self.count + n
+        self.reserve(end)
+        self.coords[start:end] = np.asarray(coords).reshape(-1, 4)
+        self.colors[start:end] = colors
+        self.label_ids[start:end] = [self.intern(label) for label in labels]
+        self.ids[start:end] = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+        self.count = end
+        self.revision += 1
+
+    def append(self, bbox: BoundingBox) -> RoiProxy:
+        """Добавление метки (поверх существующих) с копированием ее данных в массивы"""
+        self.extend(np.array([(*bbox.p0, *bbox.p1)]), [bbox.color.value], [bbox.label])
+        roi = self[-1]
+        if bbox.img is not None:
+            roi.img = bbox.img
+        return roi
+
+    def remove(self, bbox: RoiProxy):
+        """Удаление метки (порядок остальных сохраняется)"""
+        if not isinstance(bbox, RoiProxy) or bbox.store is not self:
+            raise ValueError("[RoiStore] ROI is not in this store")
+        row = self.row(bbox.id)
+        for array in (self.coords, self.colors, self.label_ids, self.ids):
+            array[row:self.count - 1] = array[row + 1:self.count]
+        self.count -= 1
+        self.images.pop(bbox.id, None)
+        self.revision += 1
+        self.stale.discard(bbox.id)
+        if self.index is not None and row < len(self.index[1]):
+            self.index[1].remove(row)
+
+    def rename(self, bbox: RoiProxy, label: str):
+        self.label_ids[self.row(bbox.id)] = self.intern(label)
+        self.revision += 1
+        if self.index is not None:
+            self.stale.add(bbox.id)
+
+    def set_coords(self, roi_id: int, p0: Tuple[int, int], p1: Tuple[int, int]):
+        self.coords[self.row(roi_id)] = (*p0, *p1)
+        self.revision += 1
+        if self.index is not None:
+            self.stale.add(roi_id)
+
+    def clear(self):
+        self.count = 0
+        self.images.clear()
+        self.revision += 1
+        self.index = None
+        self.stale.clear()
+
+    def names(self) -> List[str]:
+        """Имена меток в z-порядке"""
+        labels = self.labels
+        return [labels[i] for i in self.label_ids[:self.count].tolist()]
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """Углы int32[n, 4], цвета uint32[n] и имена меток (массивы - представления без копирования)"""
+        return self.coords[:self.count], self.colors[:self.count], self.names()
+
+    def rects(self) -> np.ndarray:
+        """Нормализованные прямоугольники int32[n, 4] (x0, y0, x1, y1) в пикселях изображения"""
+        coords = self.coords[:self.count]
+        return np.concatenate([np.minimum(coords[:, :2], coords[:, 2:]),
+                               np.maximum(coords[:, :2], coords[:, 2:])], axis=1)
+
+    def with_images(self) -> List[RoiProxy]:
+        """Метки с вырезанными областями"""
+        return [RoiProxy(self, roi_id) for roi_id in self.ids[:self.count].tolist() if roi_id in self.images]
+
+    def layout(self, view: Optional[ViewTransform] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Рамки и области подписей в координатах поля вывода (кэшируются до изменения меток или масштаба)
+        :return: int32[n, 4] (x, y, ширина, высота) рамок и подписей
+        """
+        view = view if view is not None else self.identity
+        key = (id(view), view.version, self.revision)
+        if self.cached_layout is not None and self.cached_layout[0] == key:
+            return self.cached_layout[1], self.cached_layout[2]
+        metrics = labelMetrics()
+        if len(self.text_sizes) < len(self.labels):  # Размер подписи считается один раз на имя
+            sizes = [(rect.width(), rect.height()) for rect in
+                     (metrics.boundingRect(label) for label in self.labels[len(self.text_sizes):])]
+            self.text_sizes = np.concatenate([self.text_sizes, np.array(sizes, dtype=np.int32).reshape(-1, 2)])
+        boxes = view.rectsToWidget(self.coords[:self.count])
+        texts = np.empty_like(boxes)
+        texts[:, 0] = boxes[:, 0]
+        texts[:, 1] = boxes[:, 1] - metrics.height()
+        texts[:, 2:] = self.text_sizes[self.label_ids[:self.count]]
+        self.cached_layout = (key, boxes, texts)
+        return boxes, texts
+
+    def paint(self, painter: QPainter, view: ViewTransform):
+        """
+        Рисование всех меток активным QPainter в координатах поля вывода
+        (шрифт labelFont() должен быть выставлен вызывающим)
+        """
+        if not self.count:
+            return
+        boxes, texts = self.layout(view)
+        colors = self.colors[:self.count]
+        label_ids = self.label_ids[:self.count]
+        for color in np.unique(colors).tolist():  # Рамки и подписи одного цвета - одним вызовом
+            rows = np.flatnonzero(colors == color)
+            painter.setPen(QtGui.QPen(Qt.GlobalColor(color), 4))
+            painter.drawRects([QRect(*rect) for rect in boxes[rows].tolist()]
+                              + [QRect(*rect) for rect in texts[rows].tolist()])
+            # Текст рисуется тем же пером, что и рамка, - подпись остается цвета своей метки
+            for (x, y, _, _), label_id in zip(texts[rows].tolist(), label_ids[rows].tolist()):
+                text = self.texts.get(label_id)
+                if text is None:
+                    text = self.texts[label_id] = QStaticText(self.labels[label_id])
+                painter.drawStaticText(QPointF(x, y), text)
+
+    def spatial_index(self, view: Optional[ViewTransform], eps: int) -> SpatialIndex:
+        """
+        Индекс поиска по клику. Полностью строится только при первом поиске после смены преобразования;
+        добавленные сверху и измененные с прошлого поиска метки дописываются в индекс, удаленные
+        убираются из него сразу
+        """
+        view = view if view is not None else self.identity
+        key = (id(view), view.version, eps)
+        boxes, texts = self.layout(view)
+        if self.index is None or self.index[0] != key:
+            self.index = (key, SpatialIndex(eps=eps))
+            self.index[1].build(boxes, texts)
+            self.stale.clear()
+        index = self.index[1]
+        if self.stale:
+            ids = np.fromiter(self.stale, dtype=np.int64, count=len(self.stale))
+            self.stale.clear()
+            rows = np.searchsorted(self.ids[:len(index)], ids)
+            rows = rows[rows < len(index)]
+            rows = rows[np.isin(self.ids[rows], ids)]
+            index.update(rows, boxes[rows], texts[rows])
+        if len(index) < self.count:
+            index.extend(boxes[len(index):], texts[len(index):])
+        return index
+
+    def hit(self, x: int, y: int, view: Optional[ViewTransform] = None,
+            eps: int = 8) -> Tuple[Optional[RoiProxy], Optional[str]]:
+        """
+        Поиск метки под точкой поля вывода: выше по z-порядку выигрывает, у одной метки подпись важнее рамки.
+        Точная проверка выполняется только для меток из ячейки точки в SpatialIndex
+        :param eps: допуск попадания в границу рамки, пикселей поля
+        :return: (метка, вид попадания LABEL/BORDER) или (None, None)
+        """
+        if not self.count:
+            return None, None
+        rows = np.unique(self.spatial_index(view, eps).candidates(x, y))
+        if not len(rows):
+            return None, None
+        boxes, texts = self.layout(view)
+        boxes, texts = boxes[rows], texts[rows]
+        on_label = ((texts[:, 0] <= x) & (x < texts[:, 0] + texts[:, 2])
+                    & (texts[:, 1] <= y) & (y < texts[:, 1] + texts[:, 3]))
+        left, top = boxes[:, 0], boxes[:, 1]
+        right, bottom = left + boxes[:, 2], top + boxes[:, 3]
+        near = (left - eps <= x) & (x < right + eps) & (top - eps <= y) & (y < bottom + eps)
+        on_border = near & ((np.abs(x - left) < eps) | (np.abs(x - right) < eps)
+                            | (np.abs(y - top) < eps) | (np.abs(y - bottom) < eps))
+        hits = np.flatnonzero(on_label | on_border)
+        if not len(hits):
+            return None, None
+        hit = int(hits[-1])  # Строки кандидатов отсортированы - последняя выше по z-порядку
+        return RoiProxy(self, int(self.ids[rows[hit]])), LABEL if on_label[hit] else BORDER
@@ -0,0 +1,138 @@
+import os
+from bisect import bisect_right
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class SeekIndex:
+    """
+    Индекс перемотки видеофайла: номера ключевых кадров и метки времени всех кадров.
+    Переход к кадру N выполняется перемоткой на ближайший ключевой кадр не позже N и
+    пропуском (grab без перевода в BGR) не более одной группы кадров (GOP).
+    """
+    VERSION = 1
+
+    def __init__(self, keyframes: np.ndarray, timestamps: np.ndarray, fps: float):
+        self.keyframes = keyframes  # Номера ключевых кадров (по возрастанию)
+        self.timestamps = timestamps  # Метки времени кадров, мс
+        self.fps = fps
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @staticmethod
+    def index_path(video_path: str) -> str:
+        """Путь до кэша индекса (рядом с файлом сессии)"""
+        return os.path.splitext(video_path)[0] + ".sidx"
+
+    def keyframe(self, frame: int) -> int:
+        """Ближайший ключевой кадр не позже заданного"""
+        pos = bisect_right(self.keyframes, frame) - 1
+        return int(self.keyframes[pos]) if pos >= 0 else 0
+
+    def frame_at(self, msec: float) -> int:
+        """Номер кадра, показываемого в момент msec"""
+        pos = int(np.searchsorted(self.timestamps, msec, side="right")) - 1
+        return min(max(pos, 0), len(self) - 1)
+
+    def seek(self, capture: cv2.VideoCapture, frame: int) -> int:
+        """
+        Перемотка так, чтобы следующий read() вернул кадр frame
+        :param capture: открытый видеофайл
+        :param frame: номер кадра
+        :return: номер кадра, который будет прочитан следующим
+        """
+        if not len(self):
+            return 0
+        frame = min(max(frame, 0), len(self) - 1)
+        key = self.keyframe(frame)
+        capture.set(cv2.CAP_PROP_POS_FRAMES, key)
+        for _ in range(frame - key):
+            if not capture.grab():
+                break
+        return frame
+
+    @classmethod
+    def build(cls, path: str, cancelled: Callable[[], bool] = lambda: False) -> Optional["SeekIndex"]:
+        """
+        Построение индекса одним проходом по файлу без декодирования кадров
+        (чтение сжатых пакетов, флаг ключевого кадра берется из контейнера)
+        :param path: путь до видео
+        :param cancelled: функция проверки отмены построения
+        :return: индекс или None при отмене
+        """
+        capture = cv2.VideoCapture(path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+        raw = capture.isOpened()
+        if not raw:  # Бэкенд без чтения пакетов - обычное чтение, каждый кадр считается опорным
+            capture = cv2.VideoCapture(path)
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        keyframes, timestamps = [], []
+        while capture.grab():
+            if cancelled():
+                capture.release()
+                return None
+            if not raw or capture.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(len(timestamps))
+            timestamps.append(capture.get(cv2.CAP_PROP_POS_MSEC))
+        capture.release()
+        return cls(np.array(keyframes or [0], dtype=np.int64), np.array(timestamps, dtype=np.float64), fps)
+
+    def save(self, path: str, video_path: str):
+        """Сохранение кэша индекса (с размером и временем изменения видео для проверки актуальности)"""
+        stat = os.stat(video_path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            np.savez(fp, keyframes=self.keyframes, timestamps=self.timestamps,
+                     meta=np.array([self.VERSION, stat.st_size, stat.st_mtime_ns, self.fps], dtype=np.float64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, video_path: str) -> Optional["SeekIndex"]:
+        """Загрузка кэша индекса; None, если кэша нет или видео изменилось"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                version, size, mtime, fps = data["meta"]
+                stat = os.stat(video_path)
+                if version != cls.VERSION or size != stat.st_size or mtime != float(stat.st_mtime_ns):
+                    return None
+                return cls(data["keyframes"], data["timestamps"], float(fps))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def open(cls, video_path: str, cancelled: Callable[[], bool] = lambda: False) -> Optional["SeekIndex"]:
+        """Индекс из кэша или построенный заново (с сохранением кэша); None при отмене"""
+        path = cls.index_path(video_path)
+        index = cls.load(path, video_path)
+        if index is None:
+            print(f"[SeekIndex] Building index for {video_path}")
+            index = cls.build(video_path, cancelled)
+            if index is None:
+                return None
+            try:
+                index.save(path, video_path)
+            except OSError as e:
+                print(f"[SeekIndex] Can't save index: {e}")
+        return index
+
+
+class SeekIndexBuilder(QThread):
+    """Фоновое построение (или загрузка из кэша) индекса перемотки"""
+    ready_signal = pyqtSignal(object)
+
+    def __init__(self, video_path: str):
+        super().__init__()
+        self.video_path = video_path
+
+    def run(self):
+        index = SeekIndex.open(self.video_path, self.isInterruptionRequested)
+        if index is None:
+            print("[SeekIndex] Index building is cancelled")
+            return
+        print(f"[SeekIndex] Frames: {len(index)}, keyframes: {len(index.keyframes)}")
+        self.ready_signal.emit(index)
@@ -1,10 +1,13 @@
 from collections import defaultdict
 from enum import Enum
-from typing import Dict, List
+from typing import Optional, Tuple
 
 from PyQt6.QtCore import QRect
 
 from utils.BoundingBox import BoundingBox
+from utils.RoiExporter import RoiExporter, unique_names
+from utils.RoiStore import RoiStore
+from utils.ViewTransform import ViewTransform
 
 
 class StreamType(Enum):
@@ -22,7 +25,7 @@ class Session:
         self.fileName = None  # Название файла
         self.folderName = None  # Название папки
         self.workingDir = None
-        self.bboxes: List[BoundingBox] = []  # Сохраненные метки
+        self.bboxes = RoiStore()  # Сохраненные метки (массивы координат, цветов и имен)
         self.camera_id = None
         self.streamType: StreamType = StreamType.none  # Вид данных
 
@@ -47,16 +50,47 @@ class Session:
         self.workingDir = state["workingDir"]
         self.streamType = StreamType(state["streamType"])
         self.camera_id = state["camera_id"]
-        self.bboxes = []
+        self.bboxes = RoiStore()
         for label, points in state["bboxes"].items():
             p0 = points["p0"]
             p1 = points["p1"]
             bbox = BoundingBox(*p0, *p1, label=label)
             self.bboxes.append(bbox)
 
-    def save(self):
-        for bbox in self.bboxes:
-            bbox.save(self.workingDir)
+    def add_bbox(self, bbox: BoundingBox):
+        """Добавление метки (поверх существующих)"""
+        self.bboxes.append(bbox)
+
+    def remove_bbox(self, bbox: BoundingBox):
+        """Удаление метки"""
+        self.bboxes.remove(bbox)
+
+    def rename_bbox(self, bbox: BoundingBox, label: str):
+        """Переименование метки (меняется размер области подписи)"""
+        self.bboxes.rename(bbox, label)
+
+    def hit_test(self, x: int, y: int,
+                 view: Optional[ViewTransform] = None) -> Tuple[Optional[BoundingBox], Optional[str]]:
+        """
+        Поиск метки под точкой
+        :param x: координата x в координатах поля вывода
+        :param y: координата y в координатах поля вывода
+        :param view: преобразование координат меток (пиксели изображения) в координаты поля
+        :return: (метка, вид попадания RoiStore.LABEL/BORDER) или (None, None)
+        """
+        return self.bboxes.hit(x, y, view)
+
+    def save(self, exporter: Optional[RoiExporter] = None):
+        """
+        Сохранение областей интереса в рабочую директорию
+        :param exporter: фоновый экспортер; если не задан - сохранение выполняется сразу в текущем потоке
+        """
+        if exporter is not None:
+            exporter.export(self.bboxes.with_images(), self.workingDir)
+            return
+        bboxes = self.bboxes.with_images()
+        for bbox, name in zip(bboxes, unique_names(bbox.label for bbox in bboxes)):
+            bbox.save(self.workingDir, name)
 
     def load(self):
         pass
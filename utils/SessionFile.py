@@ -0,0 +1,134 @@
+"""
+Формат файла сессии (.ssn):
+    MAGIC (6 байт) | версия (uint16) | длина заголовка (uint32) | заголовок (JSON, UTF-8) | тело
+Заголовок содержит метаданные сессии и кол-во меток и читается без загрузки тела.
+Тело: координаты меток int32[n, 4] (x0, y0, x1, y1) в пикселях исходного изображения (кадра),
+цвета uint32[n], имена меток (JSON-список).
+Все числа - little-endian. Имена хранятся списком, поэтому одинаковые имена не затирают друг друга.
+"""
+import io
+import json
+import os
+import pickle
+import struct
+from typing import List, Tuple
+
+import numpy as np
+
+MAGIC = b"DMSSN\0"
+VERSION = 1
+_PREFIX = struct.Struct("<6sHI")
+_COORDS = np.dtype("<i4")
+_COLORS = np.dtype("<u4")
+# Ошибки чтения поврежденной, обрезанной или недоступной сессии (вызывающий начинает новую сессию)
+READ_ERRORS = (ValueError, KeyError, EOFError, OSError, pickle.UnpicklingError)
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Загрузка старых сессий-pickle: разрешены только классы сессии, произвольный код не исполняется"""
+    allowed = {("utils.Session", "Session"), ("utils.Session", "StreamType")}
+
+    def find_class(self, module, name):
+        if (module, name) not in self.allowed:
+            raise pickle.UnpicklingError(f"[SessionFile] Forbidden class {module}.{name}")
+        return super().find_class(module, name)
+
+
+def _read_prefix(fp) -> Tuple[int, dict]:
+    prefix = fp.read(_PREFIX.size)
+    if len(prefix) < _PREFIX.size or not prefix.startswith(MAGIC):
+        raise ValueError("[SessionFile] Not a session file")
+    _, version, header_size = _PREFIX.unpack(prefix)
+    if version > VERSION:
+        raise ValueError(f"[SessionFile] Unsupported session version {version}")
+    return version, json.loads(fp.read(header_size).decode("utf-8"))
+
+
+def is_legacy(path: str) -> bool:
+    """Сессия сохранена старой версией приложения (pickle)"""
+    with open(path, "rb") as fp:
+        return fp.read(1) == b"\x80"
+
+
+def read_header(path: str) -> dict:
+    """
+    Чтение только заголовка сессии (метаданные и кол-во меток) без загрузки тела
+    :param path: путь до файла сессии
+    :return: словарь метаданных
+    """
+    with open(path, "rb") as fp:
+        _, header = _read_prefix(fp)
+    return header
+
+
+def read_body(path: str) -> Tuple[dict, np.ndarray, np.ndarray, List[str]]:
+    """
+    Чтение сессии без создания объектов приложения (не требует Qt)
+    :param path: путь до файла сессии
+    :return: заголовок, координаты int32[n, 4], цвета uint32[n], имена меток
+    """
+    with open(path, "rb") as fp:
+        _, header = _read_prefix(fp)
+        n = header["count"]
+        coords = np.frombuffer(fp.read(n * 4 * _COORDS.itemsize), dtype=_COORDS).reshape(n, 4)
+        colors = np.frombuffer(fp.read(n * _COLORS.itemsize), dtype=_COLORS)
+        labels = json.loads(fp.read().decode("utf-8"))
+    if len(coords) != n or len(colors) != n or len(labels) != n:
+        raise ValueError("[SessionFile] Session file is truncated")
+    return header, coords, colors, labels
+
+
+def write_session(session, path: str):
+    """
+    Сохранение сессии (через временный файл, чтобы сбой не оставил испорченный файл)
+    :param session: сессия utils.Session.Session
+    :param path: путь до файла сессии
+    """
+    coords, colors, labels = session.bboxes.arrays()
+    header = {"filePath": session.filePath,
+              "fileName": session.fileName,
+              "folderName": session.folderName,
+              "workingDir": session.workingDir,
+              "streamType": session.streamType.value,
+              "camera_id": session.camera_id,
+              "count": len(labels)}
+    coords = coords.astype(_COORDS, copy=False)
+    colors = colors.astype(_COLORS, copy=False)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+
+    buffer = io.BytesIO()
+    buffer.write(_PREFIX.pack(MAGIC, VERSION, len(header_bytes)))
+    buffer.write(header_bytes)
+    buffer.write(coords.tobytes())
+    buffer.write(colors.tobytes())
+    buffer.write(json.dumps(labels, ensure_ascii=False).encode("utf-8"))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+def read_session(path: str):
+    """
+    Загрузка сессии; старые сессии-pickle загружаются безопасно и переводятся в текущую версию при следующем сохранении
+    :param path: путь до файла сессии
+    :return: сессия utils.Session.Session
+    """
+    from utils.Session import Session, StreamType
+
+    if is_legacy(path):
+        print(f"[SessionFile] Migrating legacy session {path}")
+        with open(path, "rb") as fp:
+            return _LegacyUnpickler(fp).load()
+
+    header, coords, colors, labels = read_body(path)
+    session = Session()
+    session.filePath = header["filePath"]
+    session.fileName = header["fileName"]
+    session.folderName = header["folderName"]
+    session.workingDir = header["workingDir"]
+    session.streamType = StreamType(header["streamType"])
+    session.camera_id = header["camera_id"]
+    session.bboxes.extend(coords, colors, labels)  # Массивы копируются в хранилище меток целиком
+    return session
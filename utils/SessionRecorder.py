@@ -0,0 +1,135 @@
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PyQt6.QtCore import QThread, QMutex, QMutexLocker, pyqtSignal
+
+from utils.FrameQueue import FrameQueue, DropPolicy
+
+Roi = Tuple[str, Tuple[int, int, int, int]]  # (имя, (x0, y0, x1, y1) в пикселях кадра)
+
+
+def safe_name(label: str) -> str:
+    """Имя метки, пригодное для имени файла"""
+    return re.sub(r'[\\/:*?"<>|]', "_", label).strip() or "roi"
+
+
+class SessionRecorder(QThread):
+    """
+    Запись видеопотока сессии: полный поток и по одному вырезанному потоку на каждую область интереса.
+    Кодирование идет в отдельном потоке; кадры поступают через ограниченный канал с вытеснением
+    старых кадров, поэтому задержки кодировщика не останавливают ни захват, ни интерфейс -
+    при переполнении кадры выбрасываются и учитываются в статистике. Емкость канала задается
+    объемом памяти (как у FrameCache): кадры в канале - буферы пула захвата, и при высоком
+    разрешении канал держит меньше кадров, не вытесняя кэш и не вынуждая выделять кадры вне пула.
+    """
+    finish_signal = pyqtSignal(str)  # Папка записи
+
+    def __init__(self, folder: str, fps: float, rois: List[Roi], budget: int = 64 * 1024 * 1024,
+                 queue_size: int = 32, fourcc: str = "mp4v"):
+        super().__init__()
+        self.folder = folder  # Папка записи (full.mp4 и <метка>.mp4)
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.budget = budget  # Максимальный объем кадров в канале, байт (не меньше двух кадров)
+        self.queue_size = queue_size  # Максимальное кол-во кадров в канале (для малых кадров)
+        self.queue = FrameQueue(queue_size, DropPolicy.drop_oldest, self.done)  # Элементы - (кадр, release)
+        self.frame_bytes = 0  # Размер кадра, по которому рассчитана емкость канала
+        self.mutex = QMutex()
+        self.rois: List[Roi] = list(rois)  # Области, передаются в поток кодирования под мьютексом
+        self.writers: Dict[str, cv2.VideoWriter] = {}  # Имя файла -> кодировщик
+        self.written = 0  # Кол-во записанных кадров полного потока
+        self.peak_depth = 0  # Максимальная глубина канала
+
+    @staticmethod
+    def session_folder(working_dir: Optional[str], stem: str) -> str:
+        """Папка новой записи: <папка сессии>/<имя>_rec_<дата_время>"""
+        return os.path.join(working_dir or os.getcwd(), f"{stem}_rec_{time.strftime('%Y%m%d_%H%M%S')}")
+
+    def put(self, frame: np.ndarray, release: Optional[Callable[[np.ndarray], None]] = None):
+        """
+        Передача кадра на запись (вызывается из потока захвата, никогда не ждет)
+        Кадр не копируется: после передачи его нельзя изменять.
+        :param release: возврат буфера кадра после записи или выброса (например, FramePool.release)
+        """
+        if frame.nbytes != self.frame_bytes:  # Первый кадр или смена разрешения источника
+            self.frame_bytes = frame.nbytes
+            self.queue.setMaxsize(min(max(self.budget // max(frame.nbytes, 1), 2), self.queue_size))
+        self.queue.put((frame, release))
+        depth = len(self.queue)
+        if depth > self.peak_depth:
+            self.peak_depth = depth
+
+    def setRois(self, rois: List[Roi]):
+        """Изменение набора областей: новые области записываются с текущего кадра, удаленные закрываются"""
+        with QMutexLocker(self.mutex):
+            self.rois = list(rois)
+
+    @staticmethod
+    def done(item: Tuple[np.ndarray, Optional[Callable[[np.ndarray], None]]]):
+        """Кадр записан или выброшен - буфер возвращается владельцу"""
+        frame, release = item
+        if release is not None:
+            release(frame)
+
+    def stop(self):
+        """Завершение записи: уже принятые кадры дописываются, затем файлы закрываются"""
+        self.queue.close()
+
+    def writer(self, name: str, width: int, height: int) -> Optional[cv2.VideoWriter]:
+        writer = self.writers.get(name)
+        if writer is None:
+            writer = cv2.VideoWriter(os.path.join(self.folder, f"{name}.mp4"), self.fourcc, self.fps, (width, height))
+            if not writer.isOpened():
+                print(f"[SessionRecorder] Can't open writer {name}")
+            self.writers[name] = writer
+        return writer if writer.isOpened() else None
+
+    def write(self, frame: np.ndarray):
+        h, w = frame.shape[:2]
+        writer = self.writer("full", w, h)
+        if writer is not None:
+            writer.write(frame)
+            self.written += 1
+        with QMutexLocker(self.mutex):
+            rois = self.rois
+        active = {"full"}
+        for label, (x0, y0, x1, y1) in rois:
+            x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+            if x1 - x0 < 2 or y1 - y0 < 2:
+                continue
+            name = f"roi_{safe_name(label)}_{x0}_{y0}_{x1 - x0}x{y1 - y0}"  # Размер потока фиксирован
+            active.add(name)
+            writer = self.writer(name, x1 - x0, y1 - y0)
+            if writer is not None:
+                writer.write(np.ascontiguousarray(frame[y0:y1, x0:x1]))
+        for name in [name for name in self.writers if name not in active]:  # Метка удалена или изменена
+            self.writers.pop(name).release()
+
+    def run(self):
+        print(f"[SessionRecorder] Recording to {self.folder}")
+        os.makedirs(self.folder, exist_ok=True)
+        while True:
+            item = self.queue.get(100)
+            if item is None:
+                if self.queue.closed and not len(self.queue):
+                    break
+                continue
+            self.write(item[0])
+            self.done(item)
+        for writer in self.writers.values():
+            writer.release()
+        self.writers.clear()
+        print(f"[SessionRecorder] Finished: {self.stats()}")
+        self.finish_signal.emit(self.folder)
+
+    def stats(self) -> dict:
+        """Записано кадров, выброшено при переполнении канала, глубина канала"""
+        queue = self.queue.stats()
+        return {"recorded": self.written,
+                "record_dropped": queue["dropped"],
+                "record_depth": queue["depth"],
+                "record_peak_depth": self.peak_depth}
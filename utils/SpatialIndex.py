@@ -0,0 +1,101 @@
+from typing import Tuple
+
+import numpy as np
+
+SPAN = 1 << 21  # Диапазон номеров ячеек по каждой оси (со сдвигом для отрицательных координат)
+
+
+class SpatialIndex:
+    """
+    Пространственный индекс меток для поиска по клику - равномерная сетка поверх массивов RoiStore.
+    В ячейки заносятся только полосы вдоль четырех сторон рамки и область подписи, поэтому большие
+    рамки не заполняют сетку своей внутренней частью. Ячейки хранятся как отсортированные ключи
+    с номерами строк меток: построение - один проход numpy, поиск - двоичный поиск ключа ячейки.
+    Индекс строится в координатах поля вывода (допуск и подпись имеют экранный размер) и перестраивается
+    владельцем при смене преобразования; добавленные, измененные и удаленные метки обновляются на месте.
+    """
+
+    def __init__(self, cell: int = 64, eps: int = 8):
+        self.cell = cell  # Размер ячейки сетки
+        self.eps = eps  # Допуск попадания в границу рамки
+        self.keys = np.zeros(0, dtype=np.int64)  # Ключи ячеек (по возрастанию)
+        self.rows = np.zeros(0, dtype=np.int32)  # Строка метки для каждого ключа
+        self.count = 0  # Кол-во проиндексированных меток (строки 0..count-1)
+
+    def __len__(self):
+        return self.count
+
+    def regions(self, boxes: np.ndarray, texts: np.ndarray) -> np.ndarray:
+        """Области попадания int[5n, 4] (x0, y0, x1, y1, правая и нижняя границы не включаются): подписи и полосы рамок"""
+        e = self.eps
+        left, top = boxes[:, 0], boxes[:, 1]
+        right, bottom = left + boxes[:, 2], top + boxes[:, 3]
+        label = np.stack([texts[:, 0], texts[:, 1], texts[:, 0] + texts[:, 2], texts[:, 1] + texts[:, 3]], axis=1)
+        upper = np.stack([left - e, top - e, right + e, top + e], axis=1)
+        lower = np.stack([left - e, bottom - e, right + e, bottom + e], axis=1)
+        west = np.stack([left - e, top - e, left + e, bottom + e], axis=1)
+        east = np.stack([right - e, top - e, right + e, bottom + e], axis=1)
+        return np.concatenate([label, upper, lower, west, east]).astype(np.int64)
+
+    def cells(self, regions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Ключи ячеек, которые задевают области, и номер области для каждого ключа"""
+        low = regions[:, :2] // self.cell
+        high = (np.maximum(regions[:, 2:], regions[:, :2] + 1) - 1) // self.cell
+        nx, ny = high[:, 0] - low[:, 0] + 1, high[:, 1] - low[:, 1] + 1
+        counts = nx * ny
+        owner = np.repeat(np.arange(len(regions)), counts)
+        local = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = low[owner, 0] + local % nx[owner]
+        cy = low[owner, 1] + local // nx[owner]
+        return self.key(cx, cy), owner
+
+    def key(self, cx, cy):
+        return (cx + SPAN // 2) * SPAN + (cy + SPAN // 2)
+
+    def build(self, boxes: np.ndarray, texts: np.ndarray):
+        """
+        Построение индекса
+        :param boxes: рамки int[n, 4] (x, y, ширина, высота) в координатах поля
+        :param texts: области подписей int[n, 4] (x, y, ширина, высота)
+        """
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int32)
+        self.count = 0
+        self.extend(boxes, texts)
+
+    def insert(self, rows: np.ndarray, boxes: np.ndarray, texts: np.ndarray):
+        """Слияние ячеек меток с отсортированными ключами индекса"""
+        keys, owner = self.cells(self.regions(boxes, texts))
+        order = np.argsort(keys)
+        keys, rows = keys[order], rows[owner[order] % len(rows)].astype(np.int32)
+        at = np.searchsorted(self.keys, keys)
+        self.keys, self.rows = np.insert(self.keys, at, keys), np.insert(self.rows, at, rows)
+
+    def extend(self, boxes: np.ndarray, texts: np.ndarray):
+        """Добавление меток, следующих за уже проиндексированными (строки count..count+n-1)"""
+        n = len(boxes)
+        if n:
+            self.insert(np.arange(self.count, self.count + n), boxes, texts)
+            self.count += n
+
+    def update(self, rows: np.ndarray, boxes: np.ndarray, texts: np.ndarray):
+        """Переиндексация измененных меток (новые рамки и подписи строк rows)"""
+        if len(rows):
+            changed = np.zeros(self.count, dtype=bool)
+            changed[rows] = True
+            keep = ~changed[self.rows]
+            self.keys, self.rows = self.keys[keep], self.rows[keep]
+            self.insert(np.asarray(rows), boxes, texts)
+
+    def remove(self, row: int):
+        """Удаление метки: строки выше по z-порядку сдвигаются на одну вниз"""
+        keep = self.rows != row
+        self.keys, self.rows = self.keys[keep], self.rows[keep]
+        self.rows[self.rows > row] -= 1
+        self.count -= 1
+
+    def candidates(self, x: int, y: int) -> np.ndarray:
+        """Строки меток, области которых задевают ячейку точки (с повторами, без проверки попадания)"""
+        key = self.key(x // self.cell, y // self.cell)
+        start, end = np.searchsorted(self.keys, [key, key + 1])
+        return self.rows[start:end]
@@ -0,0 +1,234 @@
+import json
+import math
+import os
+from typing import Callable, List, Optional
+
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal, QRect, QRectF, QSize
+from PyQt6.QtGui import QPainter, QPixmap, QImageReader
+from PyQt6.QtWidgets import QLabel
+
+from utils.BoundingBox import labelFont
+from utils.FrameCache import FrameCache
+from utils.FrameHub import frameToImage
+from utils.PipelineMetrics import PipelineMetrics, PAINT
+from utils.RoiStore import RoiStore
+from utils.ViewTransform import ViewTransform
+
+TILE = 512  # Размер тайла, пикселей
+TILED_PIXELS = 64 * 1024 * 1024  # Изображения больше этого размера открываются в тайловом режиме
+STRIP = 1024  # Высота полосы при построении уровней (четная, чтобы уменьшение вдвое было точным)
+MAX_PIXELS = 1 << 40  # Предел размера при декодировании OpenCV (по умолчанию 2^30 пикселей - меньше гигапикселя)
+# OpenCV читает предел один раз при загрузке библиотеки: модуль импортируется раньше первого импорта cv2
+os.environ.setdefault("OPENCV_IO_MAX_IMAGE_PIXELS", str(MAX_PIXELS))
+
+
+class TiledImage:
+    """
+    Тайловое представление большого изображения.
+    При первом открытии изображение один раз декодируется и раскладывается на диск в кэш <имя>.tiles/:
+    исходный уровень и уменьшенные вдвое уровни (mip) в виде сырых массивов. Далее уровни
+    отображаются в память (memmap) - читаются только страницы видимых тайлов.
+    """
+    VERSION = 1
+
+    def __init__(self, cache_dir: str, width: int, height: int, channels: int, levels: int):
+        self.cache_dir = cache_dir
+        self.width, self.height, self.channels = width, height, channels
+        self.levels: List[np.memmap] = [np.memmap(self.level_path(cache_dir, level), dtype=np.uint8, mode="r",
+                                                  shape=self.level_shape(level))
+                                        for level in range(levels)]
+
+    @property
+    def size(self) -> QSize:
+        return QSize(self.width, self.height)
+
+    def level_shape(self, level: int):
+        return (max(self.height >> level, 1), max(self.width >> level, 1), self.channels)
+
+    @staticmethod
+    def level_path(cache_dir: str, level: int) -> str:
+        return os.path.join(cache_dir, f"level{level}.raw")
+
+    @staticmethod
+    def cache_path(path: str) -> str:
+        """Папка кэша тайлов рядом с изображением"""
+        return os.path.splitext(path)[0] + ".tiles"
+
+    @staticmethod
+    def is_large(path: str) -> bool:
+        """Изображение слишком велико для обычной загрузки (читается только заголовок файла)"""
+        size = QImageReader(path).size()
+        return size.isValid() and size.width() * size.height() > TILED_PIXELS
+
+    def level_for(self, scale: float) -> int:
+        """Уровень, детализации которого достаточно при масштабе вывода scale (пикселей экрана на пиксель)"""
+        if scale >= 1:
+            return 0
+        return min(int(math.log2(1. / scale)), len(self.levels) - 1)
+
+    def tile(self, level: int, tx: int, ty: int) -> np.ndarray:
+        """Тайл уровня (срез memmap без чтения с диска до обращения к пикселям)"""
+        return self.levels[level][ty * TILE:(ty + 1) * TILE, tx * TILE:(tx + 1) * TILE]
+
+    def crop(self, rect: QRect) -> np.ndarray:
+        """
+        Вырезка области из исходного уровня
+        :param rect: область в пикселях исходного изображения
+        :return: копия области (читаются только нужные строки файла)
+        """
+        rect = rect.intersected(QRect(0, 0, self.width, self.height))
+        return np.array(self.levels[0][rect.top():rect.top() + rect.height(),
+                                       rect.left():rect.left() + rect.width()])
+
+    def preview(self, max_side: int = 2048) -> np.ndarray:
+        """Наименьший уровень, наибольшая сторона которого не меньше max_side (или самый мелкий)"""
+        for level in reversed(range(len(self.levels))):
+            h, w, _ = self.level_shape(level)
+            if max(h, w) >= max_side:
+                return self.levels[level]
+        return self.levels[0]
+
+    @classmethod
+    def build(cls, path: str, cache_dir: str, cancelled: Callable[[], bool] = lambda: False) -> Optional["TiledImage"]:
+        """
+        Построение кэша: единственное полное декодирование, затем уровни строятся полосами из предыдущего уровня
+        :return: тайловое изображение или None при отмене
+        :raise OSError: изображение не удалось декодировать
+        """
+        import cv2  # OpenCV нужен только при построении кэша
+        try:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+        except cv2.error as e:  # Превышен предел OPENCV_IO_MAX_IMAGE_PIXELS (или 2^20 по стороне) либо нехватка памяти
+            size = QImageReader(path).size()
+            raise OSError(f"Изображение {size.width()}x{size.height()} не удалось декодировать "
+                          f"(предел {os.environ['OPENCV_IO_MAX_IMAGE_PIXELS']} пикселей)") from e
+        if image is None:
+            raise OSError("Формат файла не поддерживается или файл поврежден")
+        os.makedirs(cache_dir, exist_ok=True)
+        height, width, channels = image.shape
+        levels = max(int(math.log2(max(width, height) / TILE)) + 1, 1)
+        level0 = np.memmap(cls.level_path(cache_dir, 0), dtype=np.uint8, mode="w+", shape=image.shape)
+        level0[:] = image
+        del image
+        previous = level0
+        for level in range(1, levels):
+            if cancelled():
+                return None
+            h, w = max(height >> level, 1), max(width >> level, 1)
+            current = np.memmap(cls.level_path(cache_dir, level), dtype=np.uint8, mode="w+", shape=(h, w, channels))
+            for y in range(0, h, STRIP // 2):
+                strip = previous[2 * y:2 * y + STRIP]
+                rows = min(STRIP // 2, h - y)
+                current[y:y + rows] = cv2.resize(np.asarray(strip), (w, rows), interpolation=cv2.INTER_AREA)
+            current.flush()
+            previous = current
+        level0.flush()
+        stat = os.stat(path)
+        meta = {"version": cls.VERSION, "width": width, "height": height, "channels": channels,
+                "levels": levels, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        with open(os.path.join(cache_dir, "meta.json"), "w") as fp:  # Пишется последним - признак готовности кэша
+            json.dump(meta, fp)
+        return cls(cache_dir, width, height, channels, levels)
+
+    @classmethod
+    def open(cls, path: str, cancelled: Callable[[], bool] = lambda: False) -> Optional["TiledImage"]:
+        """
+        Открытие кэша тайлов (с построением, если кэша нет или изображение изменилось)
+        :return: тайловое изображение или None при отмене
+        :raise OSError: изображение не удалось декодировать
+        """
+        cache_dir = cls.cache_path(path)
+        try:
+            with open(os.path.join(cache_dir, "meta.json")) as fp:
+                meta = json.load(fp)
+            stat = os.stat(path)
+            if meta["version"] == cls.VERSION and meta["size"] == stat.st_size and meta["mtime"] == stat.st_mtime_ns:
+                return cls(cache_dir, meta["width"], meta["height"], meta["channels"], meta["levels"])
+        except (OSError, ValueError, KeyError):
+            pass
+        print(f"[TiledImage] Building tile cache for {path}")
+        return cls.build(path, cache_dir, cancelled)
+
+
+class TiledImageBuilder(QThread):
+    """Фоновое открытие (или построение кэша) тайлового изображения"""
+    ready_signal = pyqtSignal(object)
+    failed_signal = pyqtSignal(str)  # Описание ошибки (при отмене не отправляется)
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+    def run(self):
+        try:
+            tiled = TiledImage.open(self.path, self.isInterruptionRequested)
+        except OSError as e:
+            print(f"[TiledImage] Can't open {self.path}: {e}")
+            self.failed_signal.emit(str(e))
+            return
+        if tiled is not None:
+            self.ready_signal.emit(tiled)
+
+
+class TiledImageLabel(QLabel):
+    """
+    Поле вывода, которое в тайловом режиме рисует только видимые тайлы подходящего уровня
+    (в обычном режиме ведет себя как QLabel). Метки рисуются поверх тайлов - их пиксели изображения
+    переводятся в координаты поля общим преобразованием view.
+    """
+
+    def __init__(self, budget: int = 256 * 1024 * 1024):
+        super().__init__()
+        self.tiled: Optional[TiledImage] = None
+        self.tiles = FrameCache(budget)  # Сконвертированные тайлы в памяти
+        self.bboxes = RoiStore()  # Метки, рисуемые поверх тайлов
+        self.active_bbox = None
+        self.view = ViewTransform()  # Преобразование координат меток (владелец может подставить общее)
+        self.metrics: Optional[PipelineMetrics] = None  # Замер времени отрисовки (если задан)
+
+    def setTiledImage(self, tiled: Optional[TiledImage]):
+        self.tiled = tiled
+        self.tiles.clear()
+        self.update()
+
+    def tilePixmap(self, level: int, tx: int, ty: int) -> QPixmap:
+        key = (level, tx, ty)
+        pixmap = self.tiles.get(key)
+        if pixmap is None:
+            pixmap = QPixmap.fromImage(frameToImage(self.tiled.tile(level, tx, ty)))
+            self.tiles.put(key, pixmap, pixmap.width() * pixmap.height() * 4)
+        return pixmap
+
+    def paintEvent(self, event):
+        start = PipelineMetrics.now()
+        self.paintContents(event)
+        if self.metrics is not None:
+            self.metrics.record(PAINT, start)
+
+    def paintContents(self, event):
+        if self.tiled is None:
+            super().paintEvent(event)
+            return
+        sx = self.width() / self.tiled.width  # Пикселей поля на пиксель изображения
+        sy = self.height() / self.tiled.height
+        level = self.tiled.level_for(max(sx, sy))
+        scale = 1 << level  # Пикселей изображения на пиксель уровня
+        exposed = event.rect()
+        h, w, _ = self.tiled.level_shape(level)
+        tx0, tx1 = int(exposed.left() / sx / scale) // TILE, int(exposed.right() / sx / scale) // TILE
+        ty0, ty1 = int(exposed.top() / sy / scale) // TILE, int(exposed.bottom() / sy / scale) // TILE
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        for ty in range(ty0, min(ty1, (h - 1) // TILE) + 1):
+            for tx in range(tx0, min(tx1, (w - 1) // TILE) + 1):
+                pixmap = self.tilePixmap(level, tx, ty)
+                target = QRectF(tx * TILE * scale * sx, ty * TILE * scale * sy,
+                                pixmap.width() * scale * sx, pixmap.height() * scale * sy)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+        painter.setFont(labelFont())
+        self.view.update(self.size(), self.tiled.size)
+        self.bboxes.paint(painter, self.view)
+        if self.active_bbox is not None:
+            self.active_bbox.paint(painter, self.view.rectToWidget(self.active_bbox.p0, self.active_bbox.p1))
+        painter.end()
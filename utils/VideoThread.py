@@ -1,63 +1,387 @@
-from typing import Union
+import math
+from contextlib import nullcontext
+from typing import Union, Optional
 
 import cv2
 import numpy as np
-from PyQt6.QtCore import QThread, pyqtSignal, QMutex, QWaitCondition, QMutexLocker
+from PyQt6.QtCore import QThread, pyqtSignal, pyqtSlot, Qt
+
+from utils.CaptureScheduler import CaptureScheduler
+from utils.ChangeDetector import ChangeDetector
+from utils.CommandChannel import Command, CommandChannel
+from utils.DisplayPyramid import DisplayPyramid
+from utils.FrameCache import FrameCache
+from utils.FramePacer import FramePacer
+from utils.FramePool import FramePool
+from utils.FrameQueue import FrameQueue, DropPolicy
+from utils.PipelineMetrics import PipelineMetrics, formatStats, DECODE, DOWNSCALE, QUEUE
+from utils.SeekIndex import SeekIndex
+from utils.SessionRecorder import SessionRecorder
 
 
 class VideoThread(QThread):
     """Видеопоток, наследуется от класса QThread"""
+    MIN_RATE = 0.25  # Границы скорости воспроизведения
+    MAX_RATE = 16.
     change_pixmap_signal = pyqtSignal(np.ndarray)
     finish_signal = pyqtSignal()
+    frame_ready_signal = pyqtSignal()  # Внутренний сигнал о появлении кадра в очереди
+    scene_changed_signal = pyqtSignal(bool)  # Сцена начала меняться (True) или стала статичной (False)
 
-    def __init__(self, source: Union[int, str] = 0, fps=30):
+    def __init__(self, source: Union[int, str] = 0, fps: Optional[float] = None,
+                 policy: DropPolicy = DropPolicy.latest, queue_size: int = 2,
+                 cache_budget: int = 256 * 1024 * 1024, metrics: Optional[PipelineMetrics] = None,
+                 scheduler: Optional[CaptureScheduler] = None, decoder_threads: Optional[int] = None,
+                 change_detector: Optional[ChangeDetector] = None, rate: float = 1., skip: int = 0,
+                 display_fps: float = 30.):
         super().__init__()
+        self.queue = FrameQueue(queue_size, policy, self.discard)  # Ограниченный канал кадров до интерфейса
+        # Доставка выполняется в потоке интерфейса, поэтому соединение всегда через очередь событий
+        self.frame_ready_signal.connect(self.deliverFrame, Qt.ConnectionType.QueuedConnection)
         self.running = False  # Флаг активации
-        self.paused = bool()  # Флаг для паузы
-        self.mutex = QMutex()  # Блокировщик потока
-        self.cond = QWaitCondition()  # Условие блокировки
+        self.paused = bool()  # Флаг для паузы (запрошенное интерфейсом состояние)
+        self.commands = CommandChannel()  # Команды управления, забираются потоком между кадрами
+        self.rate = self.clampRate(rate)  # Скорость воспроизведения
+        self.skip = max(int(skip), 0)  # Кол-во непоказываемых кадров между показанными
+        self.display_fps = display_fps  # Предел частоты показа при ускоренном воспроизведении
+        self.grabbed = 0  # Кол-во кадров, пропущенных без декодирования (grab)
         self.source = source  # Источник потока (путь до видео-файла, номер веб-камеры)
-        self.fps = fps  # Кол-во кадров в секунду
+        self.fps = fps  # Кол-во кадров в секунду (None - взять из источника)
+        self.pacer: Optional[FramePacer] = None  # Планировщик вывода кадров
+        self.seek_index: Optional[SeekIndex] = None  # Индекс перемотки (строится в фоне для файлов)
+        self.position = -1  # Номер последнего показанного кадра
+        self.next_frame = 0  # Номер кадра, который декодер выдаст следующим
+        # Буферы кадров переиспользуются: декодер читает в свободный буфер, кэш отдает самые старые кадры.
+        # Канал, кэш, запись и последний показанный кадр держат ссылки на буферы и возвращают их в пул
+        self.pool = FramePool(cache_budget, queue_size + 4)
+        self.display_pool = FramePool(0, queue_size + 3)  # Буферы уменьшенных кадров
+        # Недавние кадры для шагов назад/вперед без декодирования
+        self.cache = FrameCache(cache_budget, self.pool.release)
+        self.pool.reclaim = self.cache.evictOldest
+        self.pyramid = DisplayPyramid()  # Уменьшение кадров до размера поля вывода
+        self.frame_shape: Optional[tuple] = None  # Форма кадров источника (известна после первого кадра)
+        self.full_frame: Optional[np.ndarray] = None  # Полноразмерный кадр, показанный последним (для вырезки)
+        self.metrics = metrics or PipelineMetrics()  # Задержки по этапам конвейера
+        self.frame_start = 0.  # Отметка начала декодирования последнего доставленного кадра
+        self.scheduler = scheduler  # Общий планировщик декодирования (в сетке источников)
+        self.decoder_threads = decoder_threads  # Потоков FFmpeg на источник (None - по умолчанию OpenCV)
+        self.recorder: Optional[SessionRecorder] = None  # Запись потока (кадры передаются без ожидания)
+        self.change_detector = change_detector  # Неизменившиеся кадры не передаются на вывод
+        if scheduler is not None:
+            scheduler.register(self)
 
     def run(self):
         """Запуск видеопотока"""
         print("[VideoThread] Thread is running")
         self.running = True
-        capture = cv2.VideoCapture(self.source)
-        while self.running:
-            with QMutexLocker(self.mutex):
-                while self.paused:
-                    self.cond.wait(self.mutex)
-                ret, cv_img = capture.read()
-                if ret:
-                    self.change_pixmap_signal.emit(cv_img)
-                    self.msleep(int(1000. / self.fps))
-                else:
+        self.queue.reopen()
+        if self.decoder_threads:
+            capture = cv2.VideoCapture(self.source, cv2.CAP_ANY, [cv2.CAP_PROP_N_THREADS, self.decoder_threads])
+        else:
+            capture = cv2.VideoCapture(self.source)
+        camera = isinstance(self.source, int)
+        # Камера сама выдает кадры в своем темпе, ожидание нужно только для файлов
+        self.pacer = FramePacer(self.fps or capture.get(cv2.CAP_PROP_FPS), enabled=not camera)
+        self.pacer.setRate(self.rate)
+        self.position = -1
+        self.next_frame = 0
+        paused, request = self.paused, None
+        countdown = 0  # Сколько кадров еще пропустить до следующего показанного
+        frame = None  # Кадр, на который поток захвата держит ссылку в течение шага
+        while True:
+            self.pool.release(frame)  # Кадр прошлого шага уже передан потребителям со своими ссылками
+            frame = None
+            waited = paused
+            running, paused, request = self.applyCommands(paused, request)
+            while running and paused and request is None:  # На паузе ждем следующей команды
+                self.commands.wait()
+                running, paused, request = self.applyCommands(paused, request)
+            if not running:
+                break
+            seek, request = request, None
+            still = paused  # Перемотка на паузе - показываем один кадр без ожидания
+            if waited or seek is not None:
+                self.pacer.reset()
+            target = self.position + 1 if seek is None else seek
+            start = self.metrics.now()
+            # Фоновый источник сетки показывается с пониженным темпом - лишние кадры не декодируются в BGR
+            skip = self.scheduler is not None and not still and not self.scheduler.due(self)
+            # Ускоренное воспроизведение и пропуск кадров: непоказываемые кадры только сдвигают декодер
+            if seek is not None or still:
+                countdown = 0
+            elif countdown > 0:
+                countdown -= 1
+                skip = True
+            frame = None if camera or skip else self.cache.get(target)
+            self.pool.retain(frame)
+            if frame is None:  # Кадра нет в кэше - декодируем
+                with self.scheduler.slot(self) if self.scheduler is not None else nullcontext():
+                    if not camera and target != self.next_frame:
+                        self.next_frame = self.applySeek(capture, target)
+                    if skip:
+                        ret = capture.grab()
+                        self.grabbed += 1
+                    else:
+                        ret, frame = self.read(capture)
+                        self.metrics.record(DECODE, start)
+                if not ret:
+                    if still:  # Перемотка за конец файла на паузе - остаемся на текущем кадре
+                        continue
                     break
+                target, self.next_frame = self.next_frame, self.next_frame + 1
+                if not camera and frame is not None:
+                    self.pool.retain(frame)
+                    self.cache.put(target, frame)
+                pts_ms = capture.get(cv2.CAP_PROP_POS_MSEC)
+            else:
+                pts_ms = self.frameTime(target)
+            self.position = target
+            recorder = self.recorder
+            if recorder is not None and seek is None and not still and not skip:
+                self.pool.retain(frame)  # Записываются все кадры воспроизведения, в том числе не успевшие к показу
+                recorder.put(frame, self.pool.release)
+            pts = self.pacer.timestamp(pts_ms)
+            delay = self.pacer.delay(pts)
+            if skip:  # Пропущенный кадр только выдерживает темп источника
+                if self.pacer.enabled and delay > 0:
+                    self.commands.wait(delay)
+                continue
+            stride = self.stride(camera)
+            countdown = stride - 1
+            if not still and self.pacer.late(delay):  # Отстаем больше чем на кадр
+                # Опоздавший кадр уже декодирован и показывается, а отставание догоняется
+                # пропуском следующих кадров без декодирования
+                countdown = max(countdown, math.ceil(-delay * self.rate * self.pacer.fps) - 1)
+            if not still and self.pacer.enabled and delay > 0:
+                # Ожидание прерывается командой: кадр показывается чуть раньше, команда выполняется сразу после
+                self.commands.wait(delay)
+                start += delay  # Ожидание по расписанию не входит в задержку конвейера
+            if self.change_detector is not None and not self.sceneChanged(frame, force=still or seek is not None):
+                continue  # Сцена не изменилась - кадр не конвертируется и не перерисовывается
+            downscale_start = self.metrics.now()
+            display = self.pyramid.downscale(frame, self.display_pool)
+            queued = self.metrics.now()
+            self.metrics.record(DOWNSCALE, downscale_start, queued)
+            # Канал получает свою ссылку на кадр, ссылка на уменьшенный кадр передается ему от downscale()
+            self.pool.retain(frame)
+            # При политиках latest и drop_oldest put() не ждет: при переполнении выбрасывается старый кадр.
+            # При политике block поток захвата ждет, пока интерфейс не заберет кадр; команды интерфейса
+            # (pause(), seek()) ставятся в очередь команд и этого потока не ждут, а close() закрывает канал
+            # и будит ожидающий put()
+            if self.queue.put((display, frame, start, queued)):
+                self.frame_ready_signal.emit()
+        self.pool.release(frame)
         capture.release()
+        if self.scheduler is not None:
+            self.scheduler.unregister(self)
         self.running = False
         self.paused = True
         self.finish_signal.emit()
+        print(f"[VideoThread] Frames:\n{formatStats(self.stats())}")
         print("[VideoThread] Thread is finished")
 
+    def read(self, capture: cv2.VideoCapture):
+        """Декодирование кадра в свободный буфер пула (первый кадр и кадры нового размера выделяются декодером)"""
+        buffer = self.pool.acquire(self.frame_shape) if self.frame_shape is not None else None
+        ret, frame = capture.read(image=buffer) if buffer is not None else capture.read()
+        if not ret or frame is not buffer:
+            self.pool.release(buffer)
+        if not ret:
+            return ret, None
+        if frame is not buffer:
+            self.frame_shape = frame.shape
+        return ret, frame
+
+    def discard(self, item: tuple):
+        """Возврат буферов кадра, выброшенного из канала или уже доставленного"""
+        display, frame = item[0], item[1]
+        if display is not frame:
+            self.display_pool.release(display)
+        self.pool.release(frame)
+
+    def applyCommands(self, paused: bool, request: Optional[int]):
+        """
+        Выполнение поступивших команд (в потоке захвата, между кадрами)
+        :param paused: текущее состояние паузы
+        :param request: запрошенный кадр для перемотки
+        :return: продолжать ли работу, новое состояние паузы и запрошенный кадр
+        """
+        running = True
+        for command, value in self.commands.drain():
+            if command == Command.stop:
+                running = False
+            elif command == Command.pause:
+                paused = True
+            elif command == Command.resume:
+                paused = False
+            elif command == Command.seek:
+                request = max(int(value), 0)
+            elif command == Command.step:  # Шаги складываются, даже если предыдущий еще не показан
+                request = max((self.position if request is None else request) + int(value), 0)
+            elif command == Command.rate:
+                self.pacer.setRate(self.rate)
+        return running, paused, request
+
+    def stride(self, camera: bool = False) -> int:
+        """
+        Шаг между показываемыми кадрами: заданный пропуск или больше, если при ускорении
+        частота показа превысила бы display_fps (для камер скорость не применяется)
+        """
+        stride = self.skip + 1
+        if not camera and self.pacer is not None:
+            stride = max(stride, math.ceil(self.rate * self.pacer.fps / self.display_fps - 1e-6))
+        return stride
+
+    @classmethod
+    def clampRate(cls, rate: float) -> float:
+        return min(max(float(rate), cls.MIN_RATE), cls.MAX_RATE)
+
+    def sceneChanged(self, frame: np.ndarray, force: bool = False) -> bool:
+        """Проверка изменения сцены с уведомлением о переходах между статичной и изменяющейся сценой"""
+        static = self.change_detector.static
+        changed = self.change_detector.changed(frame, force)
+        if self.change_detector.static != static:
+            self.scene_changed_signal.emit(not self.change_detector.static)
+        return changed
+
+    def frameTime(self, frame: int) -> float:
+        """Метка времени кадра по индексу перемотки (или по частоте кадров), мс"""
+        if self.seek_index is not None and frame < len(self.seek_index):
+            return float(self.seek_index.timestamps[frame])
+        return frame * 1000. / self.pacer.fps
+
+    def applySeek(self, capture: cv2.VideoCapture, frame: int) -> int:
+        """
+        Перемотка источника (выполняется в потоке захвата)
+        :return: номер кадра, который будет прочитан следующим
+        """
+        self.queue.clear()  # Кадры до перемотки больше не нужны
+        if self.seek_index is not None:
+            return self.seek_index.seek(capture, frame)
+        capture.set(cv2.CAP_PROP_POS_FRAMES, frame)  # Без индекса - перемотка средствами бэкенда
+        return int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+
+    def seek(self, frame: int):
+        """
+        Переход к кадру (на паузе показывается найденный кадр, пауза сохраняется)
+        :param frame: номер кадра
+        """
+        if isinstance(self.source, int):
+            print("[VideoThread] Camera stream can't be seeked")
+            return
+        self.commands.post(Command.seek, frame)
+
+    def setDisplaySize(self, width: int, height: int):
+        """Размер поля вывода: кадры уменьшаются до него в потоке захвата"""
+        self.pyramid.setViewSize(width, height)
+
+    def step(self, delta: int = 1):
+        """
+        Шаг на delta кадров от текущего (недавние кадры берутся из кэша без декодирования)
+        :param delta: смещение в кадрах (отрицательное - назад)
+        """
+        if isinstance(self.source, int):
+            print("[VideoThread] Camera stream can't be seeked")
+            return
+        self.commands.post(Command.step, delta)
+
+    def seekTime(self, msec: float):
+        """
+        Переход к моменту времени
+        :param msec: время от начала видео, мс
+        """
+        if self.seek_index is not None:
+            self.seek(self.seek_index.frame_at(msec))
+        elif self.pacer is not None:
+            self.seek(round(msec / 1000. * self.pacer.fps))
+
+    @pyqtSlot(object)
+    def setSeekIndex(self, index: SeekIndex):
+        """Подключение построенного в фоне индекса перемотки"""
+        self.seek_index = index
+
+    @pyqtSlot()
+    def deliverFrame(self):
+        """Передача очередного кадра из канала подписчикам (выполняется в потоке интерфейса)"""
+        self.metrics.gauge("queue_depth", len(self.queue))
+        item = self.queue.get()
+        if item is None:
+            return
+        display, frame, self.frame_start, queued = item
+        # Показанный кадр удерживается для вырезки до следующего кадра, ссылка переходит к нему из канала
+        self.pool.release(self.full_frame)
+        self.full_frame = frame
+        self.metrics.record(QUEUE, queued)
+        self.change_pixmap_signal.emit(display)  # Подписчики не удерживают кадр после возврата из слота
+        if self.pacer is not None:  # Показ отмечается при доставке: выброшенные из канала кадры не учитываются
+            self.pacer.present()
+        if display is not frame:
+            self.display_pool.release(display)
+        if len(self.queue):  # Остались кадры (политика drop_oldest) - доставим их следующим событием
+            self.frame_ready_signal.emit()
+
+    def stats(self) -> dict:
+        """
+        Счетчики канала кадров (поступило, доставлено, выброшено), темп воспроизведения
+        и задержки по этапам конвейера (ключи stages, gauges, peaks)
+        """
+        stats = self.queue.stats()
+        stats.update(self.cache.stats())
+        stats.update(self.pool.stats())
+        if self.pacer is not None:
+            stats.update(self.pacer.stats())
+            stats.update({"rate": self.rate, "stride": self.stride(isinstance(self.source, int)),
+                          "grabbed": self.grabbed})
+        if self.change_detector is not None:
+            stats.update(self.change_detector.stats())
+        stats.update(self.metrics.stats())
+        return stats
+
+    def setRate(self, rate: float):
+        """Скорость воспроизведения (1 - темп источника, от MIN_RATE до MAX_RATE)"""
+        self.rate = self.clampRate(rate)  # Сохраняется и для следующего запуска потока
+        self.commands.post(Command.rate, self.rate)
+
+    def setSkip(self, skip: int):
+        """Пропуск кадров: показывается каждый (skip + 1)-й кадр, остальные не декодируются"""
+        self.skip = max(int(skip), 0)
+
+    def start(self, *args):
+        self.commands.clear()  # Команды прошлого запуска (например, остановка после конца файла) не нужны
+        self.running = True  # До фактического запуска, чтобы close() сразу после start() не потерялся
+        super().start(*args)
+
     def close(self):
+        """Запрос остановки (не ждет завершения потока)"""
         if self.running:
             self.running = False
-            self.resume()
+            self.commands.post(Command.stop)
+            self.queue.close()
             print("[VideoThread] Closing thread")
 
+    def stop(self, timeout: int = 2000) -> bool:
+        """
+        Остановка с ограниченным ожиданием завершения
+        :param timeout: время ожидания, мс
+        :return: True, если поток завершился
+        """
+        self.close()
+        if self.wait(timeout):
+            return True
+        print(f"[VideoThread] Thread is not finished in {timeout} ms")
+        return False
+
     def pause(self):
-        print("[VideoThread] Thread is paused")
         """Выставление паузы у потока"""
-        with QMutexLocker(self.mutex):
-            self.paused = True
+        print("[VideoThread] Thread is paused")
+        self.paused = True
+        self.commands.post(Command.pause)
 
     def resume(self):
         """Возобновление после паузы"""
         if not self.paused:
             print("[VideoThread] Thread is not paused")
             return
-        with QMutexLocker(self.mutex):
-            print("[VideoThread] Thread is resumed")
-            self.paused = False
-            self.cond.wakeOne()  # Пробуждаем другие потоки
+        print("[VideoThread] Thread is resumed")
+        self.paused = False
+        self.commands.post(Command.resume)
@@ -0,0 +1,63 @@
+from typing import Tuple
+
+import numpy as np
+from PyQt6.QtCore import QPoint, QRect, QSize
+
+
+class ViewTransform:
+    """
+    Преобразование координат между полем вывода и пикселями исходного изображения (кадра).
+    Метки хранятся в пикселях изображения и не зависят от масштаба просмотра; коэффициенты
+    пересчитываются только при изменении размера поля или изображения (масштабирование,
+    вписывание в окно, смена источника), а не на каждом кадре. Кэши, построенные в координатах
+    поля (слой меток, индекс попаданий), сверяются с номером пересчета version.
+    """
+
+    def __init__(self):
+        self.widget = QSize()  # Размер поля вывода
+        self.image = QSize()  # Размер исходного изображения
+        self.sx = 1.  # Пикселей изображения на пиксель поля
+        self.sy = 1.
+        self.version = 0  # Номер пересчета
+
+    def update(self, widget: QSize, image: QSize) -> bool:
+        """
+        Обновление размеров поля и изображения
+        :return: True, если преобразование изменилось
+        """
+        if widget == self.widget and image == self.image:
+            return False
+        self.widget, self.image = QSize(widget), QSize(image)
+        valid = widget.width() > 0 and widget.height() > 0 and image.width() > 0 and image.height() > 0
+        self.sx = image.width() / widget.width() if valid else 1.
+        self.sy = image.height() / widget.height() if valid else 1.
+        self.version += 1
+        return True
+
+    def windowRect(self) -> QRect:
+        """Система координат поля вывода (для QPainter.setWindow поверх кадра любого размера)"""
+        return QRect(QPoint(0, 0), self.widget)
+
+    def toImage(self, x: float, y: float) -> Tuple[int, int]:
+        """Точка поля вывода -> пиксель изображения (в пределах изображения)"""
+        px, py = round(x * self.sx), round(y * self.sy)
+        if not self.image.isEmpty():
+            px = min(max(px, 0), self.image.width())
+            py = min(max(py, 0), self.image.height())
+        return px, py
+
+    def rectsToWidget(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Перевод прямоугольников в координаты поля вывода за один проход
+        :param coords: углы int[n, 4] (x0, y0, x1, y1) в пикселях изображения, в любом порядке
+        :return: int[n, 4] (x, y, ширина, высота) в координатах поля
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 4)
+        scale = np.array([self.sx, self.sy])
+        low = np.rint(np.minimum(coords[:, :2], coords[:, 2:]) / scale)
+        high = np.rint(np.maximum(coords[:, :2], coords[:, 2:]) / scale)
+        return np.concatenate([low, high - low], axis=1).astype(np.int32)
+
+    def rectToWidget(self, p0: Tuple[int, int], p1: Tuple[int, int]) -> Tuple[int, int, int, int]:
+        """Один прямоугольник (углы в пикселях изображения) -> (x, y, ширина, высота) в координатах поля"""
+        return tuple(self.rectsToWidget(np.array([(*p0, *p1)]))[0].tolist())